@@ -0,0 +1,361 @@
+import asyncio
+import itertools
+import threading
+from collections import namedtuple
+import serial
+
+from logger import log_to_file
+from packet_stream import PacketStream
+from framing import FLAG_POLL
+from script_handler import ScriptRunner
+from stats_collector import is_stats, print_stats
+from radio_profiles import DEFAULT_PROFILE, SWITCH_TIMEOUT, SWITCH_MARGIN, LOST_CONTACT_TIMEOUT, relay_directive
+from serial_utils.line_reader import read_lines
+from serial_utils.port_finder import find_adafruit_port
+from serial_utils.serial_interface import FINAL_TOKEN, LINK_MTU, MTU_TIMEOUT, parse_mtu_reply, parse_switch
+
+'''
+asyncio core that owns the Feather's serial port and multiplexes logical sessions over it
+(interactive commands, scripts, image retrievals, voice commands).
+
+Every command goes out with a request id ("#<id> STATUS") and the drone tags each text response
+and its END_OF_STREAM with the same id, so responses are matched to commands by id, not by
+order. Commands run in two lanes, one command in flight per lane: control commands (STATUS,
+STATS, MTU, ...) and bulk transfers (DETECT, CAMERA, ECHO, HISTORY), so a STATUS is answered
+while a DETECT is still streaming. Frames carry no request id: completed transfers go to the bulk
+command in flight (STATS frames to the control one). Framed-transfer polls are answered
+immediately by the core and never wait in a queue. The lane queues are bounded: submitting waits
+while one is full, which is the backpressure on sessions that produce commands faster than the
+link can carry them.
+STOP skips the queues and is written straight away: the drone cancels the running command, which
+still ends with its own END_OF_STREAM, and answers STOP with another.
+'''
+
+PRIORITY_CONTROL = 0
+PRIORITY_BULK = 1
+BULK_COMMANDS = ("DETECT", "CAMERA", "ECHO", "HISTORY")
+
+COMMAND_QUEUE_SIZE = 16  # Commands waiting for the link before submit() blocks
+COMMAND_TIMEOUT = 120    # seconds a command may run before its session gives up on it
+
+Response = namedtuple("Response", ["command", "lines", "transfers", "images", "complete"])
+
+
+def command_priority(command):
+    name = command.split(maxsplit=1)[0].upper() if command.strip() else ""
+    return PRIORITY_BULK if name in BULK_COMMANDS else PRIORITY_CONTROL
+
+
+def command_lane(priority):
+    return PRIORITY_CONTROL if priority <= PRIORITY_CONTROL else PRIORITY_BULK
+
+
+class _Request:
+    def __init__(self, request_id, session, command, timeout, future):
+        self.id = request_id
+        self.session = session
+        self.command = command
+        self.timeout = timeout
+        self.future = future
+        self.done = asyncio.Event()  # END_OF_STREAM seen, even if the caller stopped waiting
+        self.lines = []
+        self.transfers = []  # completed framed transfers: (transfer id, flags, data)
+
+
+class Session:
+    """
+    A logical client of the link. Requests a session awaits one after another are answered in
+    order; requests from different sessions run in the control or bulk lane by priority.
+    """
+    def __init__(self, core, name, priority=None):
+        self.core = core
+        self.name = name
+        self.priority = priority
+
+    async def request(self, command, priority=None, timeout=COMMAND_TIMEOUT):
+        if priority is None:
+            priority = self.priority if self.priority is not None else command_priority(command)
+        return await self.core.submit(command, priority, timeout, session=self)
+
+
+class BasestationCore:
+    def __init__(self, port=None, baudrate=115200, timeout=1, log_packets=True):
+        self.port = port
+        self.baudrate = baudrate
+        self.timeout = timeout
+        self.log_packets = log_packets
+        self.ser = None
+        self.stream = PacketStream()
+        self.loop = None
+        self.queues = {}      # lane -> queue of requests waiting for it
+        self.lanes = {PRIORITY_CONTROL: None, PRIORITY_BULK: None}  # lane -> request in flight
+        self.in_flight = {}   # request id -> request, STOP included
+        self.ids = itertools.count(1)
+        self.stop_event = threading.Event()
+        self.reader_thread = None
+        self.dispatchers = []
+        self.monitors = []  # asyncio queues receiving every line, e.g. for an interactive console
+        self.mtu = None     # agreed with the drone at session start
+        self.negotiation = None  # MTU negotiation task; bulk commands wait for it
+        self.profile = DEFAULT_PROFILE  # radio profile the relay is using
+        self.last_heard = 0.0
+        self.switch_waiters = {}        # profile -> event set by "[RADIO] ACTIVE <profile>"
+
+    async def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.queues = {lane: asyncio.Queue(maxsize=COMMAND_QUEUE_SIZE) for lane in self.lanes}
+        port = self.port if self.port is not None else find_adafruit_port()
+        self.ser = serial.Serial(port, self.baudrate, timeout=self.timeout)
+        print(f"[INFO] Connected to {port} at {self.baudrate} baud.")
+        log_to_file(f"[INFO] Connected to {port} at {self.baudrate} baud.")
+
+        # pyserial has no asyncio API; the blocking reader thread hands lines to the loop
+        self.reader_thread = threading.Thread(target=self._read_from_port, daemon=True)
+        self.reader_thread.start()
+        # Queued first on the control lane; the bulk lane waits for it, so every transfer runs
+        # with the negotiated payload size
+        self.negotiation = asyncio.create_task(self.negotiate_mtu())
+        self.dispatchers = [asyncio.create_task(self._dispatch(lane)) for lane in self.lanes]
+        await asyncio.sleep(0)  # let it enqueue before start() returns
+
+    async def negotiate_mtu(self, mtu=LINK_MTU):
+        response = await self.submit(f"MTU {mtu}", PRIORITY_CONTROL, MTU_TIMEOUT)
+        replies = [parse_mtu_reply(line) for line in response.lines]
+        self.mtu = next((size for size in replies if size), None)
+        if self.mtu is None:
+            print("[WARN] No MTU reply; the drone keeps its default payload size")
+        return self.mtu
+
+    async def close(self):
+        for dispatcher in self.dispatchers:
+            dispatcher.cancel()
+        self.stop_event.set()
+        if self.ser and self.ser.is_open:
+            self.ser.cancel_read()
+        if self.reader_thread:
+            await self.loop.run_in_executor(None, self.reader_thread.join)
+        if self.ser and self.ser.is_open:
+            self.ser.close()
+            print("[INFO] Serial port closed.")
+            log_to_file("[INFO] Serial port closed.")
+
+    def session(self, name, priority=None):
+        return Session(self, name, priority)
+
+    def monitor(self):
+        """
+        Returns a queue that receives every line from the Feather.
+        """
+        q = asyncio.Queue()
+        self.monitors.append(q)
+        return q
+
+    async def submit(self, command, priority=None, timeout=COMMAND_TIMEOUT, session=None):
+        """
+        Queues a command and returns its Response once its END_OF_STREAM arrives (complete=False
+        on timeout). Waits while the command's lane queue is full; STOP is sent straight away.
+        """
+        request = _Request(next(self.ids), session, command, timeout, self.loop.create_future())
+        if command.upper().split()[:1] == ["STOP"]:
+            # The drone hears STOP while a command runs and cancels it
+            await self._run(request)
+        else:
+            if priority is None:
+                priority = command_priority(command)
+            await self.queues[command_lane(priority)].put(request)
+        return await request.future
+
+    def submit_threadsafe(self, command, priority=None, timeout=COMMAND_TIMEOUT):
+        """
+        For blocking callers (scripts, speech pipelines) running outside the event loop.
+        Returns a concurrent.futures.Future resolving to the Response.
+        """
+        return asyncio.run_coroutine_threadsafe(self.submit(command, priority, timeout), self.loop)
+
+    async def _follow_switch(self, name):
+        """
+        Basestation side of the radio profile handshake (see radio_profiles.py).
+        """
+        previous = self.profile
+        active = self.switch_waiters[name] = asyncio.Event()
+        self._write(relay_directive(name))
+        self._write(f"RADIO CONFIRM {name}")
+        try:
+            await asyncio.wait_for(active.wait(), SWITCH_TIMEOUT + SWITCH_MARGIN)
+            print(f"[RADIO] Switched to {name}")
+        except asyncio.TimeoutError:
+            print(f"[RADIO] No answer on {name}, back to {previous}")
+            self._write(relay_directive(previous))
+        finally:
+            self.switch_waiters.pop(name, None)
+
+    def _check_contact(self):
+        # Same rule as the drone: after a long silence both ends return to the default profile
+        if self.profile != DEFAULT_PROFILE and self.loop.time() - self.last_heard > LOST_CONTACT_TIMEOUT:
+            print(f"[RADIO] Lost contact on {self.profile}, back to {DEFAULT_PROFILE}")
+            self.profile = DEFAULT_PROFILE
+            self.last_heard = self.loop.time()
+            self._write(relay_directive(DEFAULT_PROFILE))
+
+    def _write(self, command):
+        print(f"[SEND] {command}")
+        log_to_file(f"[SEND] {command}")
+        self.ser.write((command + "\r\n").encode("utf-8"))
+        self.ser.flush()
+
+    def _finish(self, request, complete):
+        request.done.set()
+        if request.future.done():
+            return
+        # Legacy text/hex images only come from bulk commands
+        images = self.stream.legacy_images() if request is self.lanes[PRIORITY_BULK] else []
+        response = Response(request.command, request.lines, request.transfers, images, complete)
+        request.future.set_result(response)
+
+    async def _dispatch(self, lane):
+        queue = self.queues[lane]
+        if lane == PRIORITY_BULK and self.negotiation is not None:
+            await asyncio.wait([self.negotiation])
+        while True:
+            request = await queue.get()
+            if request.future.done():  # caller went away while queued
+                continue
+            if lane == PRIORITY_BULK:
+                # Legacy images arriving from here on belong to this command
+                self.stream.clear_completed()
+            self.lanes[lane] = request
+            try:
+                await self._run(request)
+            finally:
+                self.lanes[lane] = None
+
+    async def _run(self, request):
+        """
+        Sends one tagged command and waits for its END_OF_STREAM.
+        """
+        self.in_flight[request.id] = request
+        try:
+            self._check_contact()
+            self._write(f"#{request.id} {request.command}")
+            await asyncio.wait_for(request.done.wait(), request.timeout)
+        except asyncio.TimeoutError:
+            print(f"[✗] Timeout waiting for {request.command}")
+            self._finish(request, complete=False)
+        except serial.SerialException as e:
+            print(f"[ERROR] Failed to send command: {e}")
+            log_to_file(f"[ERROR] Failed to send command: {e}")
+            self._finish(request, complete=False)
+        finally:
+            self.in_flight.pop(request.id, None)
+
+    def _read_from_port(self):
+        def on_line(line):
+            try:
+                text = line.decode("utf-8")
+            except UnicodeDecodeError:
+                log_to_file("[FEATHER] [BINARY DATA]")
+                return
+            self.loop.call_soon_threadsafe(self._handle_line, text)
+
+        try:
+            read_lines(self.ser, on_line, self.stop_event)
+        except Exception as e:
+            print(f"[ERROR] Serial read error: {e}")
+            log_to_file(f"[ERROR] Serial read error: {e}")
+
+    def _handle_line(self, text):
+        print(f"[FEATHER] {text}")
+        if self.log_packets:
+            log_to_file(f"[FEATHER] {text}")
+        for q in self.monitors:
+            q.put_nowait(text)
+
+        packet = self.stream.feed_line(text)
+        if packet is None:
+            return
+        self.last_heard = self.loop.time()
+        if packet.frame is not None:
+            if is_stats(packet.frame.flags):
+                print_stats(packet.frame.payload)
+            if packet.transfer is not None:
+                control, bulk = self.lanes[PRIORITY_CONTROL], self.lanes[PRIORITY_BULK]
+                owner = control if is_stats(packet.frame.flags) else bulk or control
+                if owner is not None:
+                    owner.transfers.append(packet.transfer)
+            # The drone is waiting on this ACK; it bypasses the command queue
+            if packet.frame.flags & FLAG_POLL:
+                self._write(self.stream.assembler.ack_command(packet.frame.transfer_id))
+            return
+        switch_to = parse_switch(packet.payload, "SWITCH")
+        if switch_to:
+            asyncio.create_task(self._follow_switch(switch_to))
+        active_profile = parse_switch(packet.payload, "ACTIVE")
+        if active_profile in self.switch_waiters:
+            self.profile = active_profile
+            self.switch_waiters[active_profile].set()
+        if packet.request is None:
+            # Untagged text (legacy image chunks) comes from the bulk command
+            if self.lanes[PRIORITY_BULK] is not None:
+                self.lanes[PRIORITY_BULK].lines.append(packet.payload)
+            return
+        # Ids no longer in flight are replies that timed out (HISTORY/RESEND replays carry their own id)
+        request = self.in_flight.get(packet.request)
+        if request is not None:
+            request.lines.append(packet.payload)
+            if FINAL_TOKEN in packet.payload:
+                self._finish(request, complete=True)
+
+
+async def run_script(core, filename):
+    """
+    Scripted session: ScriptRunner stays blocking, so it runs in a worker thread and each
+    command waits for its END_OF_STREAM before the next one is sent.
+    """
+    def send(line):
+        core.submit_threadsafe(line).result()
+    await core.loop.run_in_executor(None, ScriptRunner(send).run_script, filename)
+
+
+async def interactive(core):
+    """
+    Console session. Commands are submitted without waiting, so a SCRIPT or a long DETECT
+    keeps running while further commands are typed.
+    """
+    console = core.session("console")
+    tasks = set()
+    print(">> Type commands to send to the Feather (type 'exit' to quit):")
+    while True:
+        cmd = (await core.loop.run_in_executor(None, input, ">> ")).strip()
+        if cmd.lower() in {"exit", "quit"}:
+            break
+        if not cmd:
+            continue
+        if cmd.upper().startswith("SCRIPT"):
+            parts = cmd.split()
+            if len(parts) < 2:
+                print("[ERROR] SCRIPT command requires a filename.")
+                continue
+            task = asyncio.create_task(run_script(core, parts[1]))
+        else:
+            task = asyncio.create_task(console.request(cmd))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    for task in tasks:
+        task.cancel()
+
+
+async def main():
+    print("Basestation online. Starting asyncio core...")
+    core = BasestationCore()
+    await core.start()
+    try:
+        await interactive(core)
+    finally:
+        await core.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n[INFO] Keyboard interrupt received. Exiting...")
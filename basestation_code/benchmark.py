@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import threading
+import serial
+from serial_utils.line_reader import LineFramer, read_lines
+
+'''
+Benchmarks for the basestation side. Run from basestation_code/:
+  python benchmark.py reader [lines]
+  python benchmark.py framer [lines]
+The reader benchmark stands a pty in for the Feather, so no hardware is needed (Linux/macOS).
+'''
+
+LINE_INTERVAL = 0.01  # seconds between lines from the fake Feather
+IDLE_TIME = 1.0       # seconds of silence measured for idle CPU use
+
+
+def polling_reader(ser, on_line, stop_event):
+    """
+    The previous reader loop: poll in_waiting every 50 ms and split off one line at a time.
+    """
+    buf = b""
+    while not stop_event.is_set():
+        if ser.in_waiting:
+            buf += ser.read(ser.in_waiting)
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            on_line(line)
+        time.sleep(0.05)
+
+
+def polling_framer(chunks):
+    buf = b""
+    lines = []
+    for chunk in chunks:
+        buf += chunk
+        while b"\n" in buf:
+            line, buf = buf.split(b"\n", 1)
+            lines.append(line)
+    return lines
+
+
+def bytearray_framer(chunks):
+    framer = LineFramer()
+    lines = []
+    for chunk in chunks:
+        lines.extend(framer.feed(chunk))
+    return lines
+
+
+def fake_feather_line(i):
+    # The send time rides in the payload so the receiver can compute per-line latency
+    payload = f"{time.perf_counter():.6f} " + "A" * 80
+    return f"[RECEIVED #{i}] [{len(payload)} bytes]: {payload}\r\n".encode()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def run_reader(reader, count):
+    master, slave = os.openpty()
+    ser = serial.Serial(os.ttyname(slave), 115200, timeout=1)
+    latencies = []
+    received = threading.Event()
+    stop = threading.Event()
+
+    def on_line(line):
+        sent = float(line.rsplit(b": ", 1)[1].split()[0])
+        latencies.append(time.perf_counter() - sent)
+        if len(latencies) == count:
+            received.set()
+
+    thread = threading.Thread(target=reader, args=(ser, on_line, stop), daemon=True)
+    thread.start()
+    for i in range(count):
+        os.write(master, fake_feather_line(i))
+        time.sleep(LINE_INTERVAL)
+    received.wait(5)
+
+    # CPU spent by the process while the link is silent
+    cpu_start = time.process_time()
+    time.sleep(IDLE_TIME)
+    idle_cpu = time.process_time() - cpu_start
+
+    stop.set()
+    ser.cancel_read()
+    thread.join()
+    ser.close()
+    os.close(master)
+    os.close(slave)
+    return latencies, idle_cpu
+
+
+def bench_reader(args):
+    count = int(args[0]) if args else 200
+    print(f"[BENCH] {count} lines from a pty fake Feather, one every {LINE_INTERVAL * 1000:.0f} ms")
+    for name, reader in (("polling", polling_reader), ("blocking", read_lines)):
+        latencies, idle_cpu = run_reader(reader, count)
+        if len(latencies) < count:
+            print(f"  {name:8}: only {len(latencies)}/{count} lines received")
+            continue
+        mean = sum(latencies) / len(latencies)
+        print(f"  {name:8}: latency mean {mean * 1000:6.2f} ms | p95 {percentile(latencies, 0.95) * 1000:6.2f} ms | "
+              f"max {max(latencies) * 1000:6.2f} ms | idle CPU {idle_cpu * 1000:5.2f} ms/s")
+
+
+def bench_framer(args):
+    count = int(args[0]) if args else 20000
+    data = b"".join(fake_feather_line(i) for i in range(count))
+    for chunk_size in (64, 4096, len(data)):
+        chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+        start = time.perf_counter()
+        old = polling_framer(chunks)
+        t_old = time.perf_counter() - start
+        start = time.perf_counter()
+        new = bytearray_framer(chunks)
+        t_new = time.perf_counter() - start
+        status = "identical" if [line.rstrip(b"\r") for line in old] == new else "MISMATCH"
+        print(f"  {count} lines in {chunk_size}-byte reads: split {t_old * 1000:8.1f} ms | "
+              f"bytearray {t_new * 1000:6.1f} ms | {status}")
+
+
+BENCHMARKS = {
+    "reader": bench_reader,
+    "framer": bench_framer,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmark.py [{'|'.join(BENCHMARKS)}] [args...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
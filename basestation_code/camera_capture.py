@@ -1,97 +1,110 @@
-from serial_utils.serial_interface import SerialInterface
+import asyncio
 from pathlib import Path
-from reconstructor import extract_chunks, reconstruct_binary, reconstruct_text
-import time
-import shutil
+from basestation_core import BasestationCore
+from serial_utils.serial_interface import CAPTURE_TIMEOUT
+from reconstructor import reconstruct_binary, reconstruct_text
+from frame_decoder import save_transfer, save_mosaic, FrameCache, DETECTIONS_CSV, FRAME_CACHE_FILE
+from framing import CONTENT_MASK, CONTENT_LAYER, CONTENT_MOSAIC, CONTENT_DELTA
 
-LOG_PATH = Path(__file__).resolve().parent / "terminal.txt"
+'''
+Image retrievals as sessions of the asyncio core, which owns the serial link (framed-poll ACKs,
+MTU negotiation, radio profile switches). capture_camera/capture_detect take a running core;
+camera_capture()/detect_capture() start one for a single run.
+'''
 
-def camera_capture():
-    # connect feather
-    print("Basestation online. Starting serial interface for camera capture...")
-    serial_interface = SerialInterface()
-    serial_interface.connect()
-    serial_interface.start_reader()
-    serial_interface.camera_capture()
+BASE_DIR = Path(__file__).resolve().parent
+OUT_FRAMED = "reconstructed_frame.png"
+DETECT_TIMEOUT = 60  # seconds
 
-    # construct image
-    b64, hx = extract_chunks()
-    if b64:
-        reconstruct_text()
-    elif hx:
-        reconstruct_binary()
-    else:
-        print("[✗] No image data found in terminal.txt")
+async def capture_camera(core, mode="frame"):
+    """
+    mode is the CAMERA mode; progressive images are rendered layer by layer while they arrive.
+    Frames are cached in frame_cache.json so a delta frame can be applied to a reference
+    received in an earlier run.
+    """
+    stream = core.stream
+    if stream.frames.path is None:
+        stream.frames = FrameCache(path=str(BASE_DIR / FRAME_CACHE_FILE))
+    response = await core.session("camera").request(f"CAMERA {mode}", timeout=CAPTURE_TIMEOUT)
 
-    # clean up
-    with open(LOG_PATH, "w"):
-        pass
+    # construct image from the transfers received for this command: binary frames first, then legacy text/hex
+    if response.transfers:
+        transfer_id, flags, data = response.transfers[-1]
+        if flags & CONTENT_MASK == CONTENT_LAYER:
+            print(f"[✓] Progressive image complete in {stream.progressive.output_path}")
+        elif flags & CONTENT_MASK == CONTENT_DELTA:
+            stream.frames.save(transfer_id, OUT_FRAMED)
+        else:
+            save_transfer(flags, data, OUT_FRAMED)
+    elif response.images:
+        kind, data = response.images[-1]
+        if kind == "b64":
+            reconstruct_text(b64_str=data)
+        else:
+            reconstruct_binary(hex_str=data)
+    else:
+        print("[✗] No image data received")
 
-def detect_capture():
+async def capture_detect(core):
     """
     Sends the DETECT command to the drone, then automatically
     reconstructs any cropped-person images that come back,
     and moves each reconstructed PNG into detect_crops/crop_1.png, etc.
     """
-    DETECT_LOG = LOG_PATH
-    OUT_DIR   = DETECT_LOG.parent / "detect_crops"
-
-    # 1) spin up serial I/O
-    print("Starting DETECT sequence over serial…")
-    serial_interface = SerialInterface()
-    serial_interface.connect()
-    serial_interface.start_reader()
-
-    try:
-        # 2) send the command
-        serial_interface.send_command("DETECT")
-
-        # 3) wait for the Pi to finish streaming
-        timeout = time.time() + 60  # seconds
-        while True:
-            data = DETECT_LOG.read_text(encoding="utf-8", errors="replace")
-            if "[RESULT] DETECTION COMPLETE" in data:
-                break
-            if time.time() > timeout:
-                print("[✗] Timeout waiting for DETECT COMPLETE")
-                return
-            time.sleep(0.5)
-
-    finally:
-        # 4) tear down serial I/O
-        serial_interface.close()
-
-    # 5) clear any old reconstructions
-    for old in DETECT_LOG.parent.glob("reconstructed_*.png"):
-        old.unlink()
+    OUT_DIR = BASE_DIR / "detect_crops"
 
-    # 6) reconstruct any base64 or hex chunks
-    b64, hx = extract_chunks()
-    if b64:
-        reconstruct_text()       # no args
-    elif hx:
-        reconstruct_binary()     
-    else:
-        print("[✗] No DETECT image data found in terminal.txt")
+    # 1) send the command and wait for the Pi to finish streaming
+    # (END_OF_STREAM without a result means nothing was detected)
+    print("Starting DETECT sequence…")
+    response = await core.session("detect").request("DETECT", timeout=DETECT_TIMEOUT)
+    if not response.complete:
+        print("[✗] Timeout waiting for DETECT COMPLETE")
         return
 
-    # 7) move each reconstructed image into detect_crops/
+    # 2) framed crops: one mosaic transfer per frame (or one transfer per crop with mosaic=off),
+    # written straight into detect_crops/ with boxes and confidences in detections.csv
     OUT_DIR.mkdir(exist_ok=True)
-    recon_files = sorted(DETECT_LOG.parent.glob("reconstructed_*.png"))
-    if not recon_files:
-        print("[✗] Reconstruction succeeded but no files found.")
-        return
-
-    for idx, src in enumerate(recon_files, start=1):
-        dst = OUT_DIR / f"crop_{idx}.png"
-        # if a file with that name already exists, overwrite it
-        if dst.exists():
-            dst.unlink()
-        shutil.move(str(src), str(dst))
-        print(f"[✓] Moved {src.name} → detect_crops/{dst.name}")
+    if response.transfers:
+        (OUT_DIR / DETECTIONS_CSV).unlink(missing_ok=True)
+        idx = 1
+        for _, flags, data in response.transfers:
+            if flags & CONTENT_MASK == CONTENT_MOSAIC:
+                idx += len(save_mosaic(flags, data, str(OUT_DIR), start=idx))
+            else:
+                save_transfer(flags, data, str(OUT_DIR / f"crop_{idx}.png"))
+                idx += 1
+    else:
+        # 3) otherwise each contiguous run of base64 or hex chunks is one crop
+        if not response.images:
+            print("[✗] No DETECT image data received")
+            return
+        for idx, (kind, data) in enumerate(response.images, start=1):
+            dst = str(OUT_DIR / f"crop_{idx}.png")
+            if kind == "b64":
+                reconstruct_text(b64_str=data, output_path=dst)
+            else:
+                reconstruct_binary(hex_str=data, output_path=dst)
 
-    # 8) clear the log for next time
-    DETECT_LOG.write_text("")
     print(f"[✓] All DETECT crops written to {OUT_DIR}/")
+
+def run_capture(capture, *args):
+    """
+    Runs one capture as the only session of a core that lives for this call.
+    """
+    async def session():
+        core = BasestationCore()
+        await core.start()
+        try:
+            await capture(core, *args)
+        finally:
+            await core.close()
+    asyncio.run(session())
+
+def camera_capture(mode="frame"):
+    print("Basestation online. Starting asyncio core for camera capture...")
+    run_capture(capture_camera, mode)
+
+def detect_capture():
+    run_capture(capture_detect)
 #camera_capture()
-detect_capture()
\ No newline at end of file
+detect_capture()
@@ -0,0 +1,117 @@
+import math
+import struct
+import reedsolo
+from framing import pack_frame, HEADER_SIZE
+
+'''
+Erasure coding for framed transfers. Data frames are grouped into blocks of k; each block gets
+m parity frames, where byte j of parity frame i is the i-th Reed-Solomon check symbol over byte j
+of the block's data payloads. Frame sequence numbers tell the receiver exactly which frames are
+missing, so any m lost frames of a block can be rebuilt from the rest without a retransmission.
+This file is shared verbatim by drone_code and basestation_code.
+
+Parity frames carry seq >= total (total counts data frames only):
+  seq = total + block * m + i, payload = FEC_INFO + parity bytes
+'''
+
+DEFAULT_FEC_BLOCK = 8  # data frames per block
+FEC_INFO = struct.Struct(">BBH")  # k, m, length of the transfer's last data payload
+
+_codecs = {}
+
+
+def _codec(m):
+    if m not in _codecs:
+        _codecs[m] = reedsolo.RSCodec(m)
+    return _codecs[m]
+
+
+def parity_count(k, ratio):
+    """
+    Parity frames per block of k for a redundancy ratio (0 disables FEC).
+    """
+    return min(255 - k, math.ceil(k * ratio)) if ratio > 0 else 0
+
+
+def block_range(block, k, total):
+    return range(block * k, min(total, (block + 1) * k))
+
+
+def interleave(total, parity_frames, k=DEFAULT_FEC_BLOCK):
+    """
+    Sequence numbers in first-pass send order: each block's data frames followed by its parity
+    frames, so a block's losses can be rebuilt as soon as the block has gone out.
+    """
+    blocks = -(-total // k)
+    m = parity_frames // blocks
+    order = []
+    for block in range(blocks):
+        order += block_range(block, k, total)
+        order += range(total + block * m, total + (block + 1) * m)
+    return order
+
+
+def encode_parity(chunks, m):
+    """
+    Returns m parity payloads (without FEC_INFO) for one block of equal-length data chunks.
+    """
+    rs = _codec(m)
+    parity = [bytearray(len(chunks[0])) for _ in range(m)]
+    for j, column in enumerate(zip(*chunks)):
+        check = rs.encode(bytes(column))[-m:]
+        for i in range(m):
+            parity[i][j] = check[i]
+    return [bytes(p) for p in parity]
+
+
+def split_frames_fec(data, flags, transfer_id, max_packet_size, k=DEFAULT_FEC_BLOCK, ratio=0.25):
+    """
+    Like framing.split_frames, followed by m = ceil(k * ratio) parity frames per block.
+    Returns (frames, number of data frames).
+    """
+    chunk = max_packet_size - HEADER_SIZE - FEC_INFO.size  # parity frames carry FEC_INFO too
+    total = max(1, -(-len(data) // chunk))
+    chunks = [data[seq * chunk:(seq + 1) * chunk] for seq in range(total)]
+    frames = [pack_frame(flags, transfer_id, seq, total, chunks[seq]) for seq in range(total)]
+
+    m = parity_count(k, ratio)
+    if not m:
+        return frames, total
+    info = FEC_INFO.pack(k, m, len(chunks[-1]))
+    for block in range(-(-total // k)):
+        padded = [chunks[seq].ljust(chunk, b"\0") for seq in block_range(block, k, total)]
+        for i, parity in enumerate(encode_parity(padded, m)):
+            frames.append(pack_frame(flags, transfer_id, total + block * m + i, total, info + parity))
+    return frames, total
+
+
+def recover_block(chunks, parity, block, total):
+    """
+    Rebuilds the missing data payloads of one block in place when enough frames arrived.
+    chunks: {seq: payload} of data frames, parity: {seq: payload} of parity frames.
+    Returns the recovered sequence numbers.
+    """
+    if not parity:
+        return []
+    k, m, last_len = FEC_INFO.unpack_from(next(iter(parity.values())))
+    seqs = block_range(block, k, total)
+    missing = [seq for seq in seqs if seq not in chunks]
+    parity_seqs = [total + block * m + i for i in range(m)]
+    erased = missing + [seq for seq in parity_seqs if seq not in parity]
+    if not missing or len(erased) > m:
+        return []
+
+    chunk = len(next(iter(parity.values()))) - FEC_INFO.size
+    rows = [chunks[seq].ljust(chunk, b"\0") if seq in chunks else bytes(chunk) for seq in seqs]
+    rows += [parity[seq][FEC_INFO.size:] if seq in parity else bytes(chunk) for seq in parity_seqs]
+    positions = [seq - seqs.start if seq < total else len(seqs) + seq - parity_seqs[0] for seq in erased]
+
+    rs = _codec(m)
+    recovered = [bytearray(chunk) for _ in missing]
+    for j, column in enumerate(zip(*rows)):
+        message = rs.decode(bytearray(column), erase_pos=positions)[0]
+        for r, seq in enumerate(missing):
+            recovered[r][j] = message[seq - seqs.start]
+    for r, seq in enumerate(missing):
+        chunks[seq] = bytes(recovered[r][:last_len if seq == total - 1 else chunk])
+    return missing
@@ -0,0 +1,332 @@
+import os
+import ast
+import csv
+import json
+import binascii
+import png
+from collections import OrderedDict
+from framing import (parse_frame, format_ack, FLAG_POLL, CONTENT_MASK, CONTENT_IMAGE, CONTENT_FILE,
+                     CONTENT_DELTA, IMAGE_INFO, LAYER_INFO, MOSAIC_INFO, CROP_INFO, DELTA_INFO)
+from fec import FEC_INFO, recover_block
+from image_codecs import decode, row_stride
+
+'''
+Decoder for binary framed transfers. The Feather relay logs every packet as
+  [RECEIVED #n] [k bytes]: <payload>
+and prints non-text packets either as hex or as a Python bytes literal. This module recovers the
+raw packet bytes from that line, validates the frame header/CRC and reassembles transfers by
+transfer id and sequence number, independent of the Base64/hex regexes in reconstructor.py.
+'''
+
+OUT_PROGRESSIVE = "reconstructed_progressive.png"
+DETECTIONS_CSV = "detections.csv"  # Box and confidence of every crop saved from a mosaic
+FRAME_CACHE_SIZE = 8  # Decoded frames kept as references for CAMERA delta transfers
+FRAME_CACHE_FILE = "frame_cache.json"
+
+RECEIVED_MARKER = "[RECEIVED #"
+PAYLOAD_MARKER = "]: "
+
+
+def packet_from_line(line):
+    """
+    Returns the raw packet bytes logged on a [RECEIVED ...] line, or None.
+    """
+    start = line.find(RECEIVED_MARKER)
+    if start < 0:
+        return None
+    _, sep, payload = line[start:].partition(PAYLOAD_MARKER)
+    if not sep:
+        return None
+    payload = payload.strip()
+    if payload.startswith(("b'", 'b"', "bytearray(")):
+        try:
+            if payload.startswith("bytearray("):
+                payload = payload[len("bytearray("):-1]
+            return bytes(ast.literal_eval(payload))
+        except (ValueError, SyntaxError):
+            return None
+    try:
+        return binascii.unhexlify(payload)
+    except (binascii.Error, ValueError):
+        return None
+
+
+class FrameAssembler:
+    """
+    Collects frames per transfer id and hands back the payload once every sequence number arrived.
+    """
+
+    def __init__(self):
+        self.transfers = {}   # transfer id -> {"flags", "total", "chunks": {seq: payload}, "parity": {...}}
+        self.completed = []   # (transfer id, flags, data) in completion order
+
+    def add_packet(self, packet):
+        frame = parse_frame(packet)
+        if frame is None:
+            return None
+        return self.add_frame(frame)
+
+    def add_frame(self, frame):
+        """
+        Stores a frame and returns the transfer id if this frame completed its transfer.
+        """
+        state = self.transfers.get(frame.transfer_id)
+        # Retransmitted frames of a completed transfer (its ACK was lost) are duplicates
+        if state is not None and state["done"] and state["total"] == frame.total:
+            return None
+        # A reused transfer id with a different shape starts a new transfer
+        if state is None or state["total"] != frame.total:
+            self._expire(frame.transfer_id)
+            state = {"flags": frame.flags & ~FLAG_POLL, "total": frame.total, "chunks": {}, "parity": {},
+                     "done": False}
+            self.transfers[frame.transfer_id] = state
+
+        if frame.seq < frame.total:
+            state["chunks"][frame.seq] = frame.payload
+            block = None
+        else:
+            # FEC parity frame: seq = total + block * m + i
+            state["parity"][frame.seq] = frame.payload
+            block = (frame.seq - frame.total) // FEC_INFO.unpack_from(frame.payload)[1]
+        if state["parity"]:
+            k, m, _ = FEC_INFO.unpack_from(next(iter(state["parity"].values())))
+            recovered = recover_block(state["chunks"], state["parity"], frame.seq // k if block is None else block,
+                                      state["total"])
+            if recovered:
+                print(f"[FEC] Transfer {frame.transfer_id}: rebuilt frames {recovered}")
+
+        if len(state["chunks"]) == state["total"]:
+            state["done"] = True
+            data = b"".join(state["chunks"][i] for i in range(state["total"]))
+            self.completed.append((frame.transfer_id, state["flags"], data))
+            return frame.transfer_id
+        return None
+
+    def _expire(self, transfer_id):
+        # Transfer ids wrap at 256; forget the half of the id space furthest behind the new one
+        for old in list(self.transfers):
+            if (transfer_id - old) % 256 >= 128:
+                del self.transfers[old]
+
+    def ack_command(self, transfer_id):
+        state = self.transfers.get(transfer_id)
+        if state is None:
+            return None
+        return format_ack(transfer_id, state["chunks"], state["total"])
+
+    def missing(self, transfer_id):
+        state = self.transfers.get(transfer_id)
+        if state is None:
+            return []
+        return [i for i in range(state["total"]) if i not in state["chunks"]]
+
+
+def assemble_log(log_path):
+    """
+    Feeds every framed packet found in a log file through a fresh FrameAssembler.
+    """
+    assembler = FrameAssembler()
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            packet = packet_from_line(line)
+            if packet:
+                assembler.add_packet(packet)
+    return assembler
+
+
+def unpack_levels(raw, bit_depth, count):
+    max_val = (1 << bit_depth) - 1
+    levels = []
+    buffer = 0
+    bits = 0
+    for byte in raw:
+        buffer = (buffer << 8) | byte
+        bits += 8
+        while bits >= bit_depth and len(levels) < count:
+            bits -= bit_depth
+            levels.append((buffer >> bits) & max_val)
+        buffer &= (1 << bits) - 1
+    return levels
+
+
+def unpack_pixels(raw, bit_depth, count):
+    scale = 255 // ((1 << bit_depth) - 1)
+    return [level * scale for level in unpack_levels(raw, bit_depth, count)]
+
+
+def resize_levels(levels, width, height, new_width, new_height):
+    """
+    Nearest-neighbor resize of a flat row-major list, same sampling as the drone's resize_array.
+    """
+    rows = [int(j * height / new_height) for j in range(new_height)]
+    cols = [int(i * width / new_width) for i in range(new_width)]
+    return [levels[r * width + c] for r in rows for c in cols]
+
+
+def write_gray_png(levels, width, height, bit_depth, output_path):
+    scale = 255 // ((1 << bit_depth) - 1)
+    img = [[v * scale for v in levels[i * width:(i + 1) * width]] for i in range(height)]
+    with open(output_path, "wb") as f:
+        writer = png.Writer(width, height, greyscale=True, bitdepth=8)
+        writer.write(f, img)
+
+
+class ProgressiveImage:
+    """
+    Rebuilds a progressive image (CONTENT_LAYER transfers) one layer at a time and renders each
+    layer scaled up to the final size, so a usable preview exists after the first few hundred bytes.
+    """
+
+    def __init__(self, output_path=OUT_PROGRESSIVE):
+        self.output_path = output_path
+        self.reset()
+
+    def reset(self):
+        self.levels = None
+        self.layer = -1
+        self.size = None
+
+    def add_layer(self, flags, data):
+        """
+        Applies one layer; returns True if the preview was updated.
+        """
+        index, layers, bit_depth, width, height = LAYER_INFO.unpack_from(data)
+        if index == 0:
+            self.reset()
+        elif index != self.layer + 1:
+            print(f"[✗] Progressive layer {index} arrived without layer {self.layer + 1}")
+            return False
+        raw = decode(data[LAYER_INFO.size:], flags, row_stride(width, bit_depth))
+        residual = unpack_levels(raw, bit_depth, width * height)
+        if self.levels is None:
+            levels = residual
+        else:
+            modulus = 1 << bit_depth
+            previous = resize_levels(self.levels, *self.size, width, height)
+            levels = [(p + r) % modulus for p, r in zip(previous, residual)]
+        self.levels, self.layer, self.size = levels, index, (width, height)
+
+        # Shown at the final size: the final layer doubles each dimension once per remaining layer
+        shift = layers - 1 - index
+        final = (width << shift, height << shift)
+        write_gray_png(resize_levels(levels, width, height, *final), *final, bit_depth, self.output_path)
+        print(f"[✓] Progressive layer {index + 1}/{layers} ({width}x{height}) rendered to {self.output_path}")
+        return True
+
+
+class FrameCache:
+    """
+    Recent full frames (CONTENT_IMAGE and CONTENT_DELTA transfers) by transfer id. A delta frame is
+    applied to the cached frame it names and cached in turn as the next possible reference.
+    With a path, the cache is kept on disk so it survives between capture runs.
+    """
+
+    def __init__(self, size=FRAME_CACHE_SIZE, path=None):
+        self.size = size
+        self.path = path
+        self.frames = OrderedDict()  # transfer id -> (bit depth, width, height, levels)
+        if path and os.path.exists(path):
+            with open(path, "r") as f:
+                for transfer_id, (bit_depth, width, height, levels) in json.load(f):
+                    self.frames[transfer_id] = (bit_depth, width, height, list(bytes.fromhex(levels)))
+
+    def add(self, transfer_id, flags, data):
+        """
+        Decodes a completed image or delta transfer. Returns its (bit depth, width, height, levels),
+        or None when a delta's reference is not cached (the drone's next keyframe fixes that).
+        """
+        if flags & CONTENT_MASK == CONTENT_DELTA:
+            ref_id, bit_depth, width, height = DELTA_INFO.unpack_from(data)
+            reference = self.frames.get(ref_id)
+            if reference is None or reference[:3] != (bit_depth, width, height):
+                print(f"[✗] Delta transfer {transfer_id}: reference frame {ref_id} not cached")
+                return None
+            raw = decode(data[DELTA_INFO.size:], flags, row_stride(width, bit_depth))
+            modulus = 1 << bit_depth
+            levels = [(r + d) % modulus for r, d in zip(reference[3], unpack_levels(raw, bit_depth, width * height))]
+        else:
+            bit_depth, width, height = IMAGE_INFO.unpack_from(data)
+            raw = decode(data[IMAGE_INFO.size:], flags, row_stride(width, bit_depth))
+            levels = unpack_levels(raw, bit_depth, width * height)
+        self.frames[transfer_id] = (bit_depth, width, height, levels)
+        self.frames.move_to_end(transfer_id)
+        while len(self.frames) > self.size:
+            self.frames.popitem(last=False)
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump([[tid, [bd, w, h, bytes(levels).hex()]] for tid, (bd, w, h, levels) in self.frames.items()], f)
+        return self.frames[transfer_id]
+
+    def save(self, transfer_id, output_path):
+        frame = self.frames.get(transfer_id)
+        if frame is None:
+            print(f"[✗] Frame {transfer_id} not available")
+            return False
+        bit_depth, width, height, levels = frame
+        write_gray_png(levels, width, height, bit_depth, output_path)
+        print(f"[✓] Frame {transfer_id} saved to {output_path}")
+        return True
+
+
+def split_mosaic(flags, data):
+    """
+    Splits a CONTENT_MOSAIC payload into (box, confidence, levels) per crop, plus the crop size and
+    bit depth: ([(box, confidence, levels), ...], (width, height), bit_depth).
+    """
+    count, bit_depth, width, height = MOSAIC_INFO.unpack_from(data)
+    offset = MOSAIC_INFO.size
+    boxes = []
+    for _ in range(count):
+        x1, y1, x2, y2, confidence = CROP_INFO.unpack_from(data, offset)
+        boxes.append(((x1, y1, x2, y2), confidence))
+        offset += CROP_INFO.size
+    raw = decode(data[offset:], flags, row_stride(width, bit_depth))
+    crop_bytes = -(-width * height * bit_depth // 8)
+    crops = [(box, confidence, unpack_levels(raw[i * crop_bytes:(i + 1) * crop_bytes], bit_depth, width * height))
+             for i, (box, confidence) in enumerate(boxes)]
+    return crops, (width, height), bit_depth
+
+
+def save_mosaic(flags, data, out_dir, start=1):
+    """
+    Writes each crop of a mosaic transfer to out_dir/crop_N.png (numbered from start) and appends
+    its box and confidence to out_dir/detections.csv. Returns the paths written.
+    """
+    crops, (width, height), bit_depth = split_mosaic(flags, data)
+    paths = []
+    with open(os.path.join(out_dir, DETECTIONS_CSV), "a", newline="") as f:
+        writer = csv.writer(f)
+        for idx, (box, confidence, levels) in enumerate(crops, start=start):
+            path = os.path.join(out_dir, f"crop_{idx}.png")
+            write_gray_png(levels, width, height, bit_depth, path)
+            writer.writerow([f"crop_{idx}.png", *box, f"{confidence:.3f}"])
+            print(f"[✓] Crop {idx} box {box} confidence {confidence:.2f} saved to {path}")
+            paths.append(path)
+    return paths
+
+
+def save_transfer(flags, data, output_path):
+    """
+    Writes a completed transfer to disk: images become grayscale PNGs, files are written as-is.
+    The codec named in flags is undone first. Returns True on success.
+    """
+    content = flags & CONTENT_MASK
+    if content == CONTENT_IMAGE:
+        bit_depth, width, height = IMAGE_INFO.unpack_from(data)
+        raw = decode(data[IMAGE_INFO.size:], flags, row_stride(width, bit_depth))
+        pixels = unpack_pixels(raw, bit_depth, width * height)
+        if len(pixels) < width * height:
+            print(f"[✗] Incomplete: got {len(pixels)} pixels")
+            return False
+        img = [pixels[i * width:(i + 1) * width] for i in range(height)]
+        with open(output_path, "wb") as f:
+            writer = png.Writer(width, height, greyscale=True, bitdepth=8)
+            writer.write(f, img)
+    elif content == CONTENT_FILE:
+        with open(output_path, "wb") as f:
+            f.write(decode(data, flags))
+    else:
+        print(f"[✗] Unknown framed content type {content}")
+        return False
+    print(f"[✓] Framed transfer saved to {output_path}")
+    return True
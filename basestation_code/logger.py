@@ -1,12 +1,151 @@
+import os
+import json
+import time
+import queue
+import atexit
+import threading
 from datetime import datetime
 from pathlib import Path
 
+'''
+Buffered logging sink for terminal.txt. log_to_file() only stamps the message and puts it on a
+bounded queue; a background thread writes queued lines in batches, flushes periodically and
+rotates the file by size, so the serial reader never waits on disk. When the queue is full new
+messages are dropped (and counted) rather than blocking the caller.
+'''
+
 LOG_PATH = Path(__file__).resolve().parent / "terminal.txt"
+LOG_FORMAT = os.environ.get("SARDRONE_LOG_FORMAT", "text")  # "text" or "jsonl"
+LOG_QUEUE_SIZE = 10000           # Messages buffered before new ones are dropped
+LOG_BATCH_SIZE = 256             # Messages written per batch
+LOG_FLUSH_INTERVAL = 0.5         # seconds between flushes to disk
+LOG_MAX_BYTES = 5 * 1024 * 1024  # Rotate once the file grows past this size
+LOG_BACKUPS = 3                  # terminal.txt.1 ... terminal.txt.N
+
+
+class LogSink:
+    def __init__(self, path=LOG_PATH, fmt=LOG_FORMAT, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS,
+                 queue_size=LOG_QUEUE_SIZE, flush_interval=LOG_FLUSH_INTERVAL):
+        if fmt not in ("text", "jsonl"):
+            raise ValueError(f"Unknown log format: {fmt}")
+        self.path = Path(path)
+        self.fmt = fmt
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, message):
+        """
+        Queues one message without blocking; returns False if it had to be dropped.
+        """
+        try:
+            self.queue.put_nowait((time.time(), message))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def flush(self, timeout=None):
+        """
+        Blocks until everything queued so far has been written to disk.
+        """
+        done = threading.Event()
+        try:
+            self.queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self):
+        self.flush(timeout=5)
+        self.stop_event.set()
+        self.thread.join(timeout=5)
+
+    def format(self, stamp, message):
+        if self.fmt == "jsonl":
+            return json.dumps({"time": datetime.fromtimestamp(stamp).isoformat(timespec="milliseconds"),
+                               "message": message}, ensure_ascii=False) + "\n"
+        return f"{datetime.fromtimestamp(stamp).strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}    {message}\n"
+
+    def _open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        f = open(self.path, "a", encoding="utf-8")
+        return f, f.tell()
+
+    def _rotate(self, f):
+        f.close()
+        for i in range(self.backups - 1, 0, -1):
+            older = self.path.with_name(f"{self.path.name}.{i}")
+            if older.exists():
+                os.replace(older, self.path.with_name(f"{self.path.name}.{i + 1}"))
+        if self.backups > 0:
+            os.replace(self.path, self.path.with_name(f"{self.path.name}.1"))
+        else:
+            self.path.unlink()
+        return self._open()
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < LOG_BATCH_SIZE:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        try:
+            f, size = self._open()
+        except OSError as e:
+            print(f"[ERROR] Logging failed: {e}")
+            return
+        last_flush = time.time()
+        while not (self.stop_event.is_set() and self.queue.empty()):
+            batch = self._next_batch()
+            lines = [self.format(*item) for item in batch if not isinstance(item, threading.Event)]
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                lines.append(self.format(time.time(), f"[LOGGER] Dropped {dropped} messages (queue full)"))
+            try:
+                if lines:
+                    text = "".join(lines)
+                    f.write(text)
+                    size += len(text.encode("utf-8"))
+                waiters = [item for item in batch if isinstance(item, threading.Event)]
+                if waiters or time.time() - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = time.time()
+                for done in waiters:
+                    done.set()
+                if size >= self.max_bytes:
+                    f, size = self._rotate(f)
+            except OSError as e:
+                print(f"[ERROR] Logging failed: {e}")
+        f.close()
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+def get_sink():
+    global _sink
+    if _sink is None:
+        with _sink_lock:
+            if _sink is None:
+                _sink = LogSink()
+                atexit.register(_sink.close)
+    return _sink
 
 def log_to_file(message):
-    try:
-        #print(f"[DEBUG] Logging message to {LOG_PATH}")
-        with open(str(LOG_PATH), "a", encoding="utf-8") as f:
-            f.write(f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')[:-3]}    {message}\n")
-    except Exception as e:
-        print(f"[ERROR] Logging failed: {e}")
+    get_sink().write(message)
+
+def flush_log(timeout=None):
+    return get_sink().flush(timeout)
@@ -2,20 +2,18 @@ import board
 import busio
 import digitalio
 import adafruit_rfm9x
+from radio_profiles import apply_profile, DEFAULT_PROFILE
 
 RADIO_FREQ_MHZ = 915.0
 BAUD_RATE = 19200
 
-def get_lora_radio():
+def get_lora_radio(profile=DEFAULT_PROFILE):
     spi = busio.SPI(board.SCK, MOSI=board.MOSI, MISO=board.MISO)
     chip_select = digitalio.DigitalInOut(board.CE1)
     reset = digitalio.DigitalInOut(board.D25)
     
     rfm9x = adafruit_rfm9x.RFM9x(spi, chip_select, reset, RADIO_FREQ_MHZ, baudrate=BAUD_RATE)
-    rfm9x.tx_power = 23
-    rfm9x.signal_bandwidth = 500000
-    rfm9x.spreading_factor = 7
-    rfm9x.coding_rate = 5
+    apply_profile(rfm9x, profile)
     rfm9x.enable_crc = True
     print("LoRa transceiver is initialized and tuned.")
     return rfm9x
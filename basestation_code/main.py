@@ -1,11 +1,12 @@
-from serial_utils.serial_interface import SerialInterface
+import asyncio
+from basestation_core import main as run_core
 
 def main():
-    print("Basestation online. Starting serial interface...")
-    serial_interface = SerialInterface()
-    serial_interface.connect()
-    serial_interface.start_reader()
-    serial_interface.interactive_mode()
+    # The asyncio core owns the serial port; sessions share it instead of opening their own
+    try:
+        asyncio.run(run_core())
+    except KeyboardInterrupt:
+        print("\n[INFO] Keyboard interrupt received. Exiting...")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,124 @@
+from collections import deque, namedtuple
+from frame_decoder import FrameAssembler, FrameCache, ProgressiveImage, packet_from_line, RECEIVED_MARKER, PAYLOAD_MARKER
+from framing import parse_frame, CONTENT_MASK, CONTENT_IMAGE, CONTENT_LAYER, CONTENT_DELTA
+
+'''
+In-memory receive path. Every line the Feather prints is parsed once, as it arrives:
+  - binary frames go to a FrameAssembler keyed by transfer id and sequence number; each completed
+    progressive layer is rendered straight away, and completed frames are cached as references
+    for CAMERA delta transfers
+  - legacy Base64/hex chunks are grouped into one image per contiguous run of chunks
+  - any other text payload is kept as a recent response line
+Text responses start with the id of the request they answer ("#<id> "), which is split off into
+Packet.request.
+Reconstruction then works from these buffers instead of re-scanning terminal.txt.
+'''
+
+RESPONSE_HISTORY = 200  # Recent text responses kept in memory
+
+B64_CHARS = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=")
+HEX_CHARS = frozenset("0123456789abcdefABCDEF")
+
+# Drone announcements (possibly behind a timestamp) that tell which legacy encoding follows
+HEX_ANNOUNCEMENTS = ("Sending hex image", "Sending binary image")
+TEXT_ANNOUNCEMENTS = ("Sending text image", "Preparing to send")
+
+# frame is None for text packets; transfer is the (id, flags, data) this frame completed, if any
+Packet = namedtuple("Packet", ["number", "payload", "frame", "request", "transfer"])
+
+
+def split_request(payload):
+    """
+    Returns (request id or None, text) for a text payload with an optional "#<id> " tag.
+    """
+    tag, sep, rest = payload.partition(" ")
+    if sep and tag[:1] == "#" and tag[1:].isdigit():
+        return int(tag[1:]), rest
+    return None, payload
+
+
+class PacketStream:
+    def __init__(self, history=RESPONSE_HISTORY):
+        self.assembler = FrameAssembler()
+        self.progressive = ProgressiveImage()
+        self.frames = FrameCache()
+        self.responses = deque(maxlen=history)
+        self.images = []        # completed legacy images: ("b64" | "hex", data)
+        self._run = []          # chunks of the legacy image currently arriving
+        self._run_kind = "b64"
+
+    def feed_line(self, line):
+        """
+        Parses one serial line. Returns a Packet for [RECEIVED #n] lines, otherwise None.
+        """
+        start = line.find(RECEIVED_MARKER)
+        if start < 0:
+            return None
+        number_text, _, rest = line[start + len(RECEIVED_MARKER):].partition("]")
+        _, sep, payload = rest.partition(PAYLOAD_MARKER)
+        if not sep:
+            return None
+        number = int(number_text) if number_text.isdigit() else None
+        payload = payload.strip()
+
+        packet = packet_from_line(line)
+        frame = parse_frame(packet) if packet else None
+        request = transfer = None
+        if frame is not None:
+            if self.assembler.add_frame(frame) is not None:
+                transfer = self.assembler.completed[-1]
+                self._transfer_done(*transfer)
+        else:
+            request, payload = split_request(payload)
+            self._feed_text(payload)
+        return Packet(number, payload, frame, request, transfer)
+
+    def _transfer_done(self, transfer_id, flags, data):
+        content = flags & CONTENT_MASK
+        if content == CONTENT_LAYER:
+            self.progressive.add_layer(flags, data)
+        elif content in (CONTENT_IMAGE, CONTENT_DELTA):
+            self.frames.add(transfer_id, flags, data)
+
+    def _feed_text(self, payload):
+        charset = HEX_CHARS if self._run_kind == "hex" else B64_CHARS
+        if payload and set(payload) <= charset:
+            self._run.append(payload)
+            return
+
+        # Any other text ends the current legacy image
+        self._close_run()
+        if any(a in payload for a in HEX_ANNOUNCEMENTS):
+            self._run_kind = "hex"
+        elif any(a in payload for a in TEXT_ANNOUNCEMENTS):
+            self._run_kind = "b64"
+        self.responses.append(payload)
+
+    def _close_run(self):
+        if self._run:
+            self.images.append((self._run_kind, "".join(self._run)))
+            self._run = []
+
+    def legacy_images(self):
+        """
+        Completed legacy images in arrival order, including one still open at the end of the stream.
+        """
+        self._close_run()
+        return list(self.images)
+
+    def clear_completed(self):
+        """
+        Forgets finished transfers and legacy images; transfers still arriving are kept.
+        """
+        self._close_run()
+        self.images = []
+        self.assembler.completed.clear()
+
+    def reset(self):
+        self.assembler = FrameAssembler()
+        self.progressive.reset()
+        self.frames = FrameCache(path=self.frames.path)
+        self.responses.clear()
+        self.images = []
+        self._run = []
+        self._run_kind = "b64"
@@ -8,6 +8,7 @@ import png
 LOG = "./terminal.txt"
 OUT_B64 = "reconstructed_text.png"
 OUT_BIN = "reconstructed_binary.png"
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
 def extract_chunks():
     """
@@ -32,8 +33,13 @@ def extract_chunks():
                 hex_chunks.append(data)
     return "".join(b64_chunks), "".join(hex_chunks)
 
-def reconstruct_text(bit_depth=4, size=(64,64)):
-    b64_str, _ = extract_chunks()
+def reconstruct_text(bit_depth=4, size=(64,64), b64_str=None, output_path=OUT_B64):
+    """
+    Rebuilds a text-mode image. b64_str comes from the in-memory packet stream; when it is
+    not given the chunks are extracted from the terminal log instead.
+    """
+    if b64_str is None:
+        b64_str, _ = extract_chunks()
     if not b64_str:
         print("[✗] No Base64 data found.")
         return
@@ -68,13 +74,14 @@ def reconstruct_text(bit_depth=4, size=(64,64)):
         return
 
     img = [ pixels[i*width:(i+1)*width] for i in range(height) ]
-    with open(OUT_B64, 'wb') as f:
+    with open(output_path, 'wb') as f:
         writer = png.Writer(width, height, greyscale=True, bitdepth=8)
         writer.write(f, img)
-    print(f"[✓] Text‑mode image saved to {OUT_B64}")
+    print(f"[✓] Text‑mode image saved to {output_path}")
 
-def reconstruct_binary():
-    _, hex_str = extract_chunks()
+def reconstruct_binary(hex_str=None, output_path=OUT_BIN):
+    if hex_str is None:
+        _, hex_str = extract_chunks()
     if not hex_str:
         print("[✗] No hex data found.")
         return
@@ -83,13 +90,14 @@ def reconstruct_binary():
     compressed = binascii.unhexlify(hex_str)
     print("[DEBUG] Compressed binary size:", len(compressed))
 
-    raw = zlib.decompress(compressed)
+    # PNG files are sent as they are; anything else was zlib-compressed by the drone
+    raw = compressed if compressed.startswith(PNG_SIGNATURE) else zlib.decompress(compressed)
     print("[DEBUG] Decompressed PNG size:", len(raw))
     print("[DEBUG] First 16 bytes of raw PNG:", raw[:16])
 
-    with open(OUT_BIN, 'wb') as f:
+    with open(output_path, 'wb') as f:
         f.write(raw)
-    print(f"[✓] Binary‑mode image saved to {OUT_BIN}")
+    print(f"[✓] Binary‑mode image saved to {output_path}")
 
 if __name__ == "__main__":
     # prioritize Base64 if present
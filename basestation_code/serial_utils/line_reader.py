@@ -0,0 +1,51 @@
+'''
+Serial line reading for the Feather relay. The reader blocks in ser.read() until bytes arrive
+(bounded by the port timeout so a stop request is still seen) instead of polling in_waiting,
+and LineFramer splits the stream into lines inside one bytearray without recopying it per line.
+'''
+
+MAX_LINE = 4096  # Bytes; a longer run without a newline is passed on as-is so memory stays bounded
+
+
+class LineFramer:
+    def __init__(self, max_line=MAX_LINE):
+        self.buf = bytearray()
+        self.scanned = 0  # bytes of buf already known to contain no newline
+        self.max_line = max_line
+
+    def feed(self, data):
+        """
+        Appends data and returns the complete lines it finished, without line endings.
+        """
+        self.buf += data
+        lines = []
+        start = 0
+        pos = self.scanned
+        while True:
+            end = self.buf.find(b"\n", pos)
+            if end < 0:
+                break
+            stop = end - 1 if end > start and self.buf[end - 1] == 0x0D else end
+            lines.append(bytes(self.buf[start:stop]))
+            start = pos = end + 1
+        # One compaction per read rather than one copy per line
+        if start:
+            del self.buf[:start]
+        if len(self.buf) > self.max_line:
+            lines.append(bytes(self.buf))
+            self.buf.clear()
+        self.scanned = len(self.buf)
+        return lines
+
+
+def read_lines(ser, on_line, stop_event):
+    """
+    Calls on_line(bytes) for every line received until stop_event is set. ser.read() returns as
+    soon as one byte is available, and then everything else already waiting is read with it.
+    """
+    framer = LineFramer()
+    while not stop_event.is_set():
+        data = ser.read(ser.in_waiting or 1)
+        if data:
+            for line in framer.feed(data):
+                on_line(line)
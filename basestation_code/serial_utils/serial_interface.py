@@ -1,152 +1,88 @@
-import time
-import serial
+import asyncio
 import threading
-import time
-import re
 
-from script_handler    import ScriptRunner
-from reconstructor     import reconstruct_text, reconstruct_binary
-from logger            import log_to_file
-from .port_finder      import find_adafruit_port
+'''
+Serial protocol constants and reply parsers. The port itself is owned by
+basestation_core.BasestationCore (framed-poll ACKs, MTU negotiation, radio profile switches,
+lost-contact fallback); scripts such as camera_capture.py run as sessions on it. SerialInterface
+remains as a thin blocking wrapper over the core for scripts written against the old API.
+'''
 
-from pathlib import Path
-BASE_DIR = Path(__file__).parent
-LOG_FILE = BASE_DIR.parent / "terminal.txt"
+FINAL_TOKEN = "END_OF_STREAM"  # Sent by the drone after every command
+CAPTURE_TIMEOUT = 120           # seconds to wait for a CAMERA transfer to finish
+LINK_MTU = 252                  # largest packet the Feather relay receives (RFM9x FIFO limit)
+MTU_TIMEOUT = 5                 # seconds to wait for the drone to agree on a payload size
+
+def parse_switch(line, keyword):
+    """
+    Returns the profile name from a "[RADIO] <keyword> <profile>" line, or None.
+    """
+    _, sep, rest = line.partition(f"[RADIO] {keyword} ")
+    fields = rest.split()
+    return fields[0] if sep and fields else None
+
+def parse_mtu_reply(line):
+    """
+    Returns the payload size from a "[MTU] <bytes>" reply, or None.
+    """
+    _, sep, rest = line.partition("[MTU]")
+    fields = rest.split()
+    return int(fields[0]) if sep and fields and fields[0].isdigit() else None
 
 class SerialInterface:
-    FILE_TRANSFER_GAP = 1.0  # seconds
+    """
+    Blocking front end to a BasestationCore whose event loop runs in a background thread.
+    Kept for older scripts; new code should run as a core session.
+    """
+    def __init__(self, port=None, baudrate=115200, timeout=1, log_packets=True):
+        from basestation_core import BasestationCore  # the core imports this module's constants
+        self.core   = BasestationCore(port, baudrate, timeout, log_packets)
+        self.loop   = None
+        self.thread = None
 
-    def __init__(self, port=None, baudrate=115200, timeout=1):
-        self.port     = port if port is not None else find_adafruit_port()
-        self.baudrate = baudrate
-        self.timeout  = timeout
-        self.ser      = None
-        self.stop_event    = threading.Event()
-        self.reader_thread = None
+    @property
+    def stream(self):
+        return self.core.stream
 
-    def connect(self):
-        # Ensure any prior handle is closed
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-        try:
-            self.ser = serial.Serial(self.port, self.baudrate, timeout=self.timeout)
-            print(f"[INFO] Connected to {self.port} at {self.baudrate} baud.")
-            log_to_file(f"[INFO] Connected to {self.port} at {self.baudrate} baud.")
-        except serial.SerialException as e:
-            print(f"[ERROR] Could not open serial port {self.port}: {e}")
-            log_to_file(f"[ERROR] Could not open serial port {self.port}: {e}")
-            raise
+    @property
+    def mtu(self):
+        return self.core.mtu
 
     def start_reader(self):
-        def read_from_port():
-            buf = b""
-            while not self.stop_event.is_set():
-                try:
-                    if self.ser.in_waiting:
-                        buf += self.ser.read(self.ser.in_waiting)
-                    while b"\n" in buf:
-                        line, buf = buf.split(b"\n", 1)
-                        try:
-                            text = line.decode('utf-8')
-                            print(f"[FEATHER] {text}")
-                            log_to_file(f"[FEATHER] {text}")
-                        except UnicodeDecodeError:
-                            # treat as raw/binary data; just stash it
-                            log_to_file("[FEATHER] [BINARY DATA]")
-                            buf += line
-                    time.sleep(0.05)
-                except Exception as e:
-                    print(f"[ERROR] Serial read error: {e}")
-                    log_to_file(f"[ERROR] Serial read error: {e}")
-                    break
-
-        self.connect()
-        self.reader_thread = threading.Thread(target=read_from_port, daemon=True)
-        self.reader_thread.start()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.core.start(), self.loop).result()
 
     def send_command(self, cmd):
-        if not (self.ser and self.ser.is_open):
-            print("[ERROR] Serial port not open.")
-            log_to_file("[ERROR] Serial port not open.")
-            return
-        try:
-            print(f"[SEND] {cmd}")
-            log_to_file(f"[SEND] {cmd}")
-            self.ser.write((cmd + "\r\n").encode('utf-8'))
-            self.ser.flush()
-        except serial.SerialException as e:
-            print(f"[ERROR] Failed to send command: {e}")
-            log_to_file(f"[ERROR] Failed to send command: {e}")
-            self.close()
+        # Fire and forget, as before; the response still ends up in the core's stream and log
+        self.core.submit_threadsafe(cmd)
 
-    def reconstruct_image(self, bit_depth=4, size=(64,64)):
-        try:
-            # Choose your routine
-            # Base64 text
-            reconstruct_text(
-                terminal_file=str(LOG_FILE),
-                output_path="reconstructed_text.png",
-                bit_depth=bit_depth,
-                size=size
-            )
-        except Exception:
-            # If text failed, try hex
-            try:
-                reconstruct_binary(
-                    terminal_file=str(LOG_FILE),
-                    output_path="reconstructed_binary.png",
-                    bit_depth=bit_depth,
-                    image_size=size
-                )
-            except Exception as e:
-                print(f"[ERROR] Reconstruction failed both pipelines: {e}")
-                log_to_file(f"[ERROR] Reconstruction failed: {e}")
+    def request(self, cmd, tokens=(FINAL_TOKEN,), timeout=None):
+        """
+        Sends a command and blocks until it ends. Returns the first response line containing
+        one of the tokens, or None.
+        """
+        submit = self.core.submit(cmd) if timeout is None else self.core.submit(cmd, timeout=timeout)
+        response = asyncio.run_coroutine_threadsafe(submit, self.loop).result()
+        return next((line for line in response.lines if any(token in line for token in tokens)), None)
 
-    def interactive_mode(self):
-        print(">> Type commands to send to the Feather (type 'exit' to quit):")
-        try:
-            while True:
-                cmd = input(">> ").strip()
-                if cmd.lower() in {'exit', 'quit'}:
-                    print("[INFO] Exiting interactive mode...")
-                    log_to_file("[INFO] Exiting interactive mode...")
-                    break
-
-                if cmd.upper().startswith("SCRIPT"):
-                    parts = cmd.split()
-                    if len(parts) >= 2:
-                        filename = parts[1]
-                        script_runner = ScriptRunner(self.send_command)
-                        script_runner.run_script(filename)
-                    else:
-                        print("[ERROR] SCRIPT command requires a filename.")
-                        log_to_file("[ERROR] SCRIPT command requires a filename.")
+    def negotiate_mtu(self, mtu=LINK_MTU):
+        return asyncio.run_coroutine_threadsafe(self.core.negotiate_mtu(mtu), self.loop).result()
 
-                elif cmd.upper().startswith("DISPLAY"):
-                    self.extract_and_display_image()
-
-                else:
-                    self.send_command(cmd)
-        except KeyboardInterrupt:
-            print("\n[INFO] Keyboard interrupt received. Exiting...")
-            log_to_file("[INFO] Keyboard interrupt received. Exiting...")
-        finally:
-            self.close()
-
-    def camera_capture(self):
+    def camera_capture(self, timeout=CAPTURE_TIMEOUT, mode="frame"):
         try:
-            self.send_command("CAMERA text")
-            with open(LOG_FILE, "r") as f:
-                while "SCREENSHOT SENT" not in f.read():
-                    time.sleep(0.5)
+            line = self.request(f"CAMERA {mode}", ("SCREENSHOT SENT", "SEND FAILED"), timeout)
+            if line is None:
+                print("[✗] Timeout waiting for SCREENSHOT SENT")
+            return line
         finally:
             self.close()
 
     def close(self):
-        self.stop_event.set()
-        if self.reader_thread:
-            self.reader_thread.join()
-        if self.ser and self.ser.is_open:
-            self.ser.close()
-            print("[INFO] Serial port closed.")
-            log_to_file("[INFO] Serial port closed.")
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.core.close(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop = None
@@ -0,0 +1,73 @@
+import sys
+import asyncio
+from framing import METRICS, STATS_ENTRY, CONTENT_MASK, CONTENT_STATS
+
+'''
+Decodes the drone's binary STATS frame and prints per-metric percentiles. Run from
+basestation_code/ to poll the drone through the asyncio core:
+  python stats_collector.py [interval seconds]
+'''
+
+UNITS = {"retries": "frames", "goodput": "B/s"}  # everything else is milliseconds
+
+
+def decode_stats(data):
+    """
+    name -> (count, p50, p90, p99, max)
+    """
+    stats = {}
+    for offset in range(0, len(data) - STATS_ENTRY.size + 1, STATS_ENTRY.size):
+        metric, count, *values = STATS_ENTRY.unpack_from(data, offset)
+        if metric < len(METRICS):
+            stats[METRICS[metric]] = (count, *values)
+    return stats
+
+
+def format_stats(stats):
+    if not stats:
+        return "[STATS] No samples recorded yet"
+    lines = [f"[STATS] {'metric':12} {'count':>6} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"]
+    for name in METRICS:
+        if name in stats:
+            count, p50, p90, p99, peak = stats[name]
+            lines.append(f"[STATS] {name:12} {count:6d} {p50:9.1f} {p90:9.1f} {p99:9.1f} {peak:9.1f} "
+                         f"{UNITS.get(name, 'ms')}")
+    return "\n".join(lines)
+
+
+def is_stats(flags):
+    return flags & CONTENT_MASK == CONTENT_STATS
+
+
+def print_stats(data):
+    print(format_stats(decode_stats(data)))
+
+
+async def collect(core, interval=None):
+    """
+    Requests STATS (once, or every interval seconds) and returns the last decoded summary.
+    The core prints each summary as it arrives.
+    """
+    while True:
+        response = await core.submit("STATS")
+        stats = [decode_stats(data) for _, flags, data in response.transfers if is_stats(flags)]
+        if interval is None:
+            return stats[-1] if stats else None
+        await asyncio.sleep(interval)
+
+
+async def main(interval=None):
+    from basestation_core import BasestationCore
+    core = BasestationCore(log_packets=False)
+    await core.start()
+    try:
+        await collect(core, interval)
+    finally:
+        await core.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main(float(sys.argv[1]) if len(sys.argv) > 1 else None))
+    except KeyboardInterrupt:
+        pass
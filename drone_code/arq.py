@@ -0,0 +1,106 @@
+import time
+from framing import FLAG_POLL, set_flags
+from radio_arbiter import PRIORITY_BULK
+import metrics
+
+'''
+Selective-repeat ARQ for framed transfers. The radio is half-duplex, so the window is sent as one
+burst of frames with no per-packet ACK; the last frame of the burst carries FLAG_POLL and the
+basestation answers with a single cumulative + bitmap ACK. Only sequence numbers the ACK reports
+missing are sent again.
+
+With FEC the first pass goes out in fec.interleave order, each block's parity right behind its
+data. Missing frames are only retransmitted once the first pass is over, by which time the ACK
+counts every frame the basestation rebuilt from parity.
+
+ACKs are picked up by the main loop and routed to handler.wait_for_ack while the transfer is
+handler.active_transfer. Each burst goes to the radio as one bulk job (RadioArbiter.send_burst),
+so no other packet lands in the middle of it, and STOP cancels the transfer between bursts.
+'''
+
+WINDOW_SIZE = 8        # frames per burst
+ACK_TIMEOUT = 2.0      # seconds to wait for an ACK after a poll
+MAX_TIMEOUTS = 5       # consecutive polls without an answer before giving up
+
+
+class SelectiveRepeatSender:
+    def __init__(self, handler, window=WINDOW_SIZE, ack_timeout=ACK_TIMEOUT, max_timeouts=MAX_TIMEOUTS):
+        self.handler = handler
+        self.window = window
+        self.ack_timeout = ack_timeout
+        self.max_timeouts = max_timeouts
+        self.stats = {}
+
+    def send(self, frames, transfer_id, payload_len, data_frames=None, order=None):
+        """
+        Sends every frame until all are acknowledged. Returns True on success; goodput and
+        retransmission counts are left in self.stats.
+        Frames from data_frames on are FEC parity (see fec.py): they go out once, in the first
+        pass (order, sequence order by default), and are never retransmitted; the transfer is
+        done when every data frame is acknowledged.
+        """
+        handler = self.handler
+        rfm9x = handler.rfm9x
+        data_frames = len(frames) if data_frames is None else data_frames
+        first_pass = list(range(len(frames)) if order is None else order)
+        outstanding = set(range(data_frames))
+        sent = 0
+        retransmitted = 0  # sends of a frame that was already on air
+        on_air = set()
+        timeouts = 0
+        total_timeouts = 0
+        burst = []
+        start = time.time()
+        handler.active_transfer = transfer_id
+        while handler.replies["ACK"].qsize():
+            handler.replies["ACK"].get_nowait()  # ACKs left over from an earlier transfer
+
+        try:
+            while outstanding:
+                handler.check_cancelled()
+                if timeouts:
+                    # The poll or its ACK was lost: re-poll with one frame instead of the whole burst
+                    burst = burst[-1:]
+                elif first_pass:
+                    burst, first_pass = first_pass[:self.window], first_pass[self.window:]
+                else:
+                    burst = sorted(outstanding)[:self.window]
+                packets = [frames[seq] for seq in burst[:-1]] + [set_flags(frames[burst[-1]], FLAG_POLL)]
+                rfm9x.send_burst(packets, PRIORITY_BULK)
+                sent += len(burst)
+                retransmitted += len(on_air.intersection(burst))
+                on_air.update(burst)
+
+                polled = time.perf_counter()
+                acked = handler.wait_for_ack(transfer_id, self.ack_timeout)
+                if acked is None:
+                    timeouts += 1
+                    total_timeouts += 1
+                    print(f"[ARQ] No ACK for transfer {transfer_id} ({timeouts}/{self.max_timeouts})")
+                    if timeouts >= self.max_timeouts:
+                        break
+                    continue
+                metrics.record("ack_rtt", (time.perf_counter() - polled) * 1000)
+                timeouts = 0
+                outstanding -= acked
+        finally:
+            handler.active_transfer = None
+
+        elapsed = time.time() - start
+        delivered = not outstanding
+        self.stats = {
+            "transfer_id": transfer_id,
+            "frames": len(frames),
+            "parity": len(frames) - data_frames,
+            "bytes": payload_len,
+            "sent": sent,
+            "retransmitted": retransmitted,
+            "timeouts": total_timeouts,
+            "elapsed": elapsed,
+            "goodput": payload_len / elapsed if delivered and elapsed > 0 else 0.0,
+        }
+        metrics.record("retries", self.stats["retransmitted"])
+        if delivered:
+            metrics.record("goodput", self.stats["goodput"])
+        print(f"[ARQ] transfer {transfer_id}: {self.stats}")
+        return delivered
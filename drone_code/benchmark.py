@@ -0,0 +1,263 @@
+import os
+import sys
+import time
+import tempfile
+from datetime import datetime
+from functools import partial
+import numpy as np
+import png
+from images import pack_image, pack_image_reference, load_grayscale, resize_array, dither_lists
+from dithering import floyd_steinberg, ordered_bayer
+from framing import HEADER_SIZE
+from image_codecs import CODECS, row_stride
+from payload_sizing import DEFAULT_PAYLOAD
+from radio_arbiter import PRIORITY_CONTROL
+
+'''
+Benchmarks for the drone-side pipelines. Run from drone_code/ on the Pi:
+  python benchmark.py images [capture.png ...]
+  python benchmark.py dither [capture.png ...]
+  python benchmark.py inference [model.tflite ...]
+  python benchmark.py codecs [capture.png ...]
+  python benchmark.py echo [packets]
+Without capture paths a synthetic 640x640 RGB frame is generated.
+'''
+
+CAPTURE_SIZE = (640, 640)
+
+
+def synthetic_capture(path, size=CAPTURE_SIZE, seed=0):
+    """
+    Writes a gradient-plus-noise RGB PNG roughly shaped like a camera frame.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    x = np.linspace(0, 255, width)[None, :, None]
+    y = np.linspace(0, 255, height)[:, None, None]
+    frame = (x * 0.6 + y * 0.4 + rng.normal(0, 12, (height, width, 3))).clip(0, 255).astype(np.uint8)
+    png.from_array(frame.reshape(height, width * 3), "RGB").save(path)
+    return path
+
+
+def capture_paths(args):
+    if args:
+        return args
+    return [synthetic_capture(os.path.join(tempfile.mkdtemp(), "capture.png"))]
+
+
+def timed(fn, *args, repeat=3, **kwargs):
+    """
+    Returns (best wall time in seconds, result) over repeat runs.
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_images(args):
+    for path in capture_paths(args):
+        print(f"[BENCH] {path}")
+        # The reference packer is quadratic at full resolution, so only 4bpp is timed there
+        for size, depths in (((64, 64), range(1, 8)), (CAPTURE_SIZE, (4,))):
+            for bit_depth in depths:
+                t_ref, ref = timed(pack_image_reference, path, bit_depth, size, repeat=1)
+                t_np, fast = timed(pack_image, path, bit_depth, size)
+                status = "identical" if ref == fast else "MISMATCH"
+                print(f"  {size[0]}x{size[1]} {bit_depth}bpp: python {t_ref * 1000:8.1f} ms | "
+                      f"numpy {t_np * 1000:7.1f} ms | x{t_ref / t_np:5.1f} | {status}")
+
+
+def bench_dither(args):
+    for path in capture_paths(args):
+        print(f"[BENCH] {path}")
+        image = resize_array(load_grayscale(path), (64, 64))
+        for bit_depth in (1, 2, 4):
+            t_ref, _ = timed(dither_lists, image.tolist(), bit_depth)
+            t_fs, _ = timed(floyd_steinberg, image, bit_depth)
+            t_bayer, _ = timed(ordered_bayer, image, bit_depth)
+            print(f"  64x64 {bit_depth}bpp: python FS {t_ref * 1000:6.1f} ms | "
+                  f"numpy FS {t_fs * 1000:5.1f} ms | bayer {t_bayer * 1000:5.2f} ms")
+
+
+def bench_inference(args):
+    """
+    Per-stage latency for each model variant at each thread count, after warmup.
+    """
+    import inference
+    from camera import SyntheticBackend
+
+    frame = SyntheticBackend().capture(*CAPTURE_SIZE)
+    thread_counts = sorted({1, 2, os.cpu_count() or 1})
+    for model_path in args or [inference.MODEL_PATH]:
+        for threads in thread_counts:
+            inference.load_interpreter(model_path=model_path, num_threads=threads)
+            inference.warmup()
+            for _ in range(10):
+                inference.run_inference(frame, debug_dir=None)
+            print(f"  {os.path.basename(model_path)} x{threads}: {inference.latency_report()}")
+
+
+def bytes_on_air(payload_len, frame_size=DEFAULT_PAYLOAD):
+    """
+    Frames and total bytes (headers included) for a framed transfer of payload_len bytes.
+    """
+    frames = max(1, -(-payload_len // (frame_size - HEADER_SIZE)))
+    return frames, payload_len + frames * HEADER_SIZE
+
+
+def bench_codecs(args):
+    """
+    Bytes on air and encode/decode time per codec for the payloads the drone actually sends:
+    a 64x64 crop, a 128x128 progressive-size image (both 4bpp packed) and the capture PNG itself.
+    """
+    for path in capture_paths(args):
+        print(f"[BENCH] {path}")
+        gray = load_grayscale(path)
+        with open(path, "rb") as f:
+            png_bytes = f.read()
+        payloads = [(f"{w}x{h} 4bpp", pack_image(gray, 4, (w, h)), row_stride(w, 4)) for w, h in ((64, 64), (128, 128))]
+        payloads.append(("capture PNG", png_bytes, 0))
+        for label, data, stride in payloads:
+            print(f"  {label} ({len(data)} bytes):")
+            for codec in CODECS.values():
+                t_enc, encoded = timed(codec.encode, data, stride)
+                t_dec, decoded = timed(codec.decode, encoded, stride)
+                frames, on_air = bytes_on_air(len(encoded))
+                status = "ok" if decoded == data else "MISMATCH"
+                print(f"    {codec.name:6} {len(encoded):7d} B, {frames:4d} frames, {on_air:7d} B on air | "
+                      f"encode {t_enc * 1000:7.2f} ms | decode {t_dec * 1000:7.2f} ms | {status}")
+
+
+class StubRadio:
+    """
+    Stands in for the RFM9x: sends complete instantly, nothing is ever received. Takes the
+    arbiter's send arguments too, so send_response can use it directly.
+    """
+
+    def __init__(self):
+        self.packets = 0
+        self.bytes = 0
+
+    def send(self, data, *args, **kwargs):
+        self.packets += 1
+        self.bytes += len(data)
+        return True
+
+    def send_with_ack(self, data, *args, **kwargs):
+        return self.send(data)
+
+    def receive(self, timeout=None, **kwargs):
+        time.sleep(timeout or 0)
+        return None
+
+
+def send_response_reference(handler, response, rfm9x=None, priority=PRIORITY_CONTROL):
+    """
+    The original list-of-slices CommandHandler.send_response, kept as bench_echo's baseline and
+    for byte-exactness checks.
+    """
+    rfm9x = rfm9x or handler.rfm9x
+    encoded_response = response.encode('utf-8')
+    tag = handler.request_tag()
+
+    # Determine prefix length for timestamp/logging
+    prefix_len = len(tag)
+    if handler.logging_enabled:
+        prefix_len += 30 if handler.timestamp_enabled else 20
+
+    max_data_len = handler.max_packet_size - prefix_len
+
+    # Chunk the response
+    if handler.chunking_enabled:
+        chunks = [
+            encoded_response[i:i + max_data_len]
+            for i in range(0, len(encoded_response), max_data_len)
+        ]
+    else:
+        chunks = [encoded_response]
+
+    total = len(chunks)
+    total_bytes_sent = 0
+
+    for idx, chunk in enumerate(chunks, start=1):
+        if handler.logging_enabled:
+            seq = handler.packet_history.next_seq
+            if handler.timestamp_enabled:
+                timestamp = datetime.now().strftime("%H:%M:%S")
+                prefix = f"[{timestamp} #{seq} {idx}/{total}] "
+            else:
+                prefix = f"[#{seq} {idx}/{total}] "
+            payload = tag + prefix.encode('utf-8') + chunk
+        else:
+            payload = tag + chunk
+
+        if handler.debug:
+            print("[DEBUG] Sending payload:", payload)
+        rfm9x.send_with_ack(payload, priority)
+        handler.record_sent(payload)
+
+        total_bytes_sent += len(payload)
+
+    return total_bytes_sent
+
+
+def bench_echo(args):
+    """
+    Per-packet CPU overhead of CommandHandler.send_response against a stub radio: ECHO's
+    one-packet responses and a long chunked response, with and without the logging header,
+    for the memoryview chunker and send_response_reference, straight to the radio and
+    through the RadioArbiter thread. The ECHO loop's 0.1 s pause between packets is left out.
+    """
+    from command_handler import CommandHandler
+
+    packets = int(args[0]) if args else 2000
+    radio = StubRadio()
+    handler = CommandHandler(radio)
+    handler.max_packet_size = DEFAULT_PAYLOAD
+    responses = [("ECHO", "SARDrone-echo-payload"), ("2 KB", "x" * 2048)]
+    for logging_enabled, timestamp_enabled in ((False, False), (True, True)):
+        handler.logging_enabled, handler.timestamp_enabled = logging_enabled, timestamp_enabled
+        print(f"[BENCH] logging={'on' if logging_enabled else 'off'} timestamp={'on' if timestamp_enabled else 'off'}")
+        for label, message in responses:
+            for name, send in (("memoryview", handler.send_response), ("reference", partial(send_response_reference, handler))):
+                for target, rfm9x in (("direct", radio), ("arbiter", handler.rfm9x)):
+                    sent = radio.packets
+                    start = time.perf_counter()
+                    for _ in range(packets):
+                        send(message, rfm9x)
+                    elapsed = time.perf_counter() - start
+                    per_packet = elapsed / max(1, radio.packets - sent)
+                    print(f"  {label:5} {name:10} {target:7}: {per_packet * 1e6:7.1f} us/packet")
+
+    # What the gated debug print costs when it is on (stdout to /dev/null)
+    handler.debug = True
+    with open(os.devnull, "w") as devnull:
+        stdout, sys.stdout = sys.stdout, devnull
+        try:
+            start = time.perf_counter()
+            for _ in range(packets):
+                handler.send_response(responses[0][1], radio)
+            elapsed = time.perf_counter() - start
+        finally:
+            sys.stdout = stdout
+    print(f"[BENCH] with SARDRONE_LOG_LEVEL=DEBUG: {elapsed / packets * 1e6:7.1f} us/packet (ECHO, direct)")
+
+
+BENCHMARKS = {
+    "images": bench_images,
+    "dither": bench_dither,
+    "inference": bench_inference,
+    "codecs": bench_codecs,
+    "echo": bench_echo,
+}
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in BENCHMARKS:
+        print(f"Usage: python benchmark.py [{'|'.join(BENCHMARKS)}] [args...]")
+        sys.exit(1)
+    BENCHMARKS[sys.argv[1]](sys.argv[2:])
@@ -1,6 +1,16 @@
 import os
 import subprocess
 import time
+import glob
+from io import BytesIO
+from collections import deque
+import numpy as np
+from PIL import Image
+
+FRAME_RING_SIZE = 4  # Recent frames kept in memory by the capture backend
+CAPTURE_ATTEMPTS = 3  # Tries per capture before a command gives up
+# Optional stand-in source for bench/testing: "synthetic", or an image file, directory or glob
+CAMERA_SOURCE = os.environ.get("SARDRONE_CAMERA")
 
 def capture_photo(
     save_directory="img",
@@ -35,4 +45,164 @@ def capture_photo(
         return photo_path
     except subprocess.CalledProcessError as e:
         print(f"[capture_photo] libcamera-still failed: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+class CameraBackend:
+    """
+    Long-lived capture source returning frames as HxWx3 uint8 RGB arrays.
+    Subclasses implement _grab(); the last few frames are kept in a ring.
+    """
+    name = None
+
+    def __init__(self, ring_size=FRAME_RING_SIZE):
+        self.frames = deque(maxlen=ring_size)  # (timestamp, frame)
+
+    def _grab(self, width, height):
+        raise NotImplementedError("Camera backend must implement _grab()")
+
+    def capture(self, width, height):
+        frame = self._grab(width, height)
+        self.frames.append((time.time(), frame))
+        return frame
+
+    def latest(self):
+        return self.frames[-1][1] if self.frames else None
+
+    def close(self):
+        pass
+
+
+class Picamera2Backend(CameraBackend):
+    """
+    Keeps the Pi camera open through picamera2; the pipeline is only reconfigured when the
+    requested resolution changes.
+    """
+    name = "picamera2"
+
+    def __init__(self, ring_size=FRAME_RING_SIZE):
+        super().__init__(ring_size)
+        from picamera2 import Picamera2
+        self.camera = Picamera2()
+        self.size = None
+
+    def _grab(self, width, height):
+        if self.size != (width, height):
+            if self.size is not None:
+                self.camera.stop()
+            # picamera2's "BGR888" is laid out R, G, B in memory
+            config = self.camera.create_still_configuration(main={"size": (width, height), "format": "BGR888"})
+            self.camera.configure(config)
+            self.camera.start()
+            self.size = (width, height)
+        return self.camera.capture_array("main")
+
+    def close(self):
+        self.camera.close()
+
+
+class LibcameraStillBackend(CameraBackend):
+    """
+    Fallback when picamera2 is unavailable: one libcamera-still process per frame.
+    """
+    name = "libcamera-still"
+
+    def _grab(self, width, height):
+        path = capture_photo(width=width, height=height, fmt="png")
+        if path is None:
+            raise RuntimeError("libcamera-still capture failed")
+        return np.array(Image.open(path).convert("RGB"))
+
+
+class FileBackend(CameraBackend):
+    """
+    Stand-in for testing: cycles through image files (a single path, a directory or a glob).
+    """
+    name = "file"
+
+    def __init__(self, source, ring_size=FRAME_RING_SIZE):
+        super().__init__(ring_size)
+        if os.path.isdir(source):
+            source = os.path.join(source, "*")
+        self.paths = sorted(glob.glob(source))
+        if not self.paths:
+            raise FileNotFoundError(f"No images found for {source}")
+        self.index = 0
+
+    def _grab(self, width, height):
+        path = self.paths[self.index % len(self.paths)]
+        self.index += 1
+        img = Image.open(path).convert("RGB").resize((width, height), Image.BILINEAR)
+        return np.array(img)
+
+
+class SyntheticBackend(CameraBackend):
+    """
+    Stand-in for testing: a moving gradient with sensor-like noise, no files or hardware.
+    """
+    name = "synthetic"
+
+    def __init__(self, ring_size=FRAME_RING_SIZE, seed=0):
+        super().__init__(ring_size)
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+
+    def _grab(self, width, height):
+        x = np.linspace(0, 255, width)[None, :, None]
+        y = np.linspace(0, 255, height)[:, None, None]
+        shift = (self.count * 8) % 256
+        self.count += 1
+        frame = (x * 0.6 + y * 0.4 + shift) % 256 + self.rng.normal(0, 8, (height, width, 3))
+        return frame.clip(0, 255).astype(np.uint8)
+
+
+_camera = None
+
+def get_camera():
+    """
+    Returns the process-wide capture backend, opening picamera2 if available and falling
+    back to libcamera-still otherwise. SARDRONE_CAMERA selects a stand-in source instead.
+    """
+    global _camera
+    if _camera is None and CAMERA_SOURCE:
+        _camera = SyntheticBackend() if CAMERA_SOURCE == "synthetic" else FileBackend(CAMERA_SOURCE)
+    if _camera is None:
+        try:
+            _camera = Picamera2Backend()
+        except Exception as e:
+            print(f"[camera] picamera2 unavailable ({e}), falling back to libcamera-still")
+            _camera = LibcameraStillBackend()
+        print(f"[camera] Using {_camera.name} backend")
+    return _camera
+
+def set_camera(backend):
+    """
+    Replaces the capture backend, e.g. with FileBackend or SyntheticBackend for testing.
+    """
+    global _camera
+    if _camera is not None and _camera is not backend:
+        _camera.close()
+    _camera = backend
+
+def capture_frame(width=64, height=64):
+    """
+    Captures one frame from the long-lived backend as an in-memory RGB array, or None on failure.
+    """
+    try:
+        return get_camera().capture(width, height)
+    except Exception as e:
+        print(f"[capture_frame] capture failed: {e}")
+        return None
+
+def capture_png(width=64, height=64):
+    """
+    Captures one frame from the long-lived backend and encodes it as PNG in memory, or None on
+    failure. Goes through the backend rather than libcamera-still, which cannot open the camera
+    while picamera2 holds it.
+    """
+    frame = capture_frame(width, height)
+    if frame is None:
+        return None
+    buffer = BytesIO()
+    Image.fromarray(frame).save(buffer, format="PNG")
+    return buffer.getvalue()
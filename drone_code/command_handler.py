@@ -1,19 +1,47 @@
 import os
-import subprocess
-from subprocess import STDOUT, check_output
 import time
-from datetime import datetime
-from images import convert_image, convert_binary
-from file_sender import send_file, send_binary
-import math
-import zlib
-from camera import capture_photo
-from inference import run_inference
-import csv
+from images import convert_image, convert_image_framed, convert_progressive, convert_mosaic, quantize_image
+from file_sender import send_file, send_binary, send_frames
+from framing import CONTENT_FILE, CONTENT_STATS, CONTENT_LAYER, CONTENT_MOSAIC, CONTENT_DELTA, FLAG_POLL, pack_frame, parse_frame, set_flags, parse_ack
+from camera import capture_frame, capture_png, CAPTURE_ATTEMPTS
+from inference import run_inference, latency_report, IOU_THRESH, MAX_DETECTIONS
+import queue
 import threading
-import requests
+from contextlib import contextmanager
+from packet_history import PacketHistory
+from dithering import DITHER_MODES
+from pipeline import pipelined_detect
+from payload_sizing import PayloadSizer, DEFAULT_PAYLOAD, RFM9X_MAX_PAYLOAD
+from radio_manager import ProfileManager
+from delta_frames import DeltaEncoder
+from scheduler import Cancelled, CANCEL_POLL
+from radio_arbiter import RadioArbiter, PRIORITY_CONTROL, PRIORITY_TELEMETRY, PRIORITY_BULK
+from radio_profiles import PROFILES
+from image_codecs import CODEC_IDS, DEFAULT_CODEC, encode
+import metrics
 
 MAX_HISTORY = 500  # Number of sent packets to retain in memory
+MAX_HISTORY_BYTES = 64 * 1024  # Memory bound for retained packet payloads
+MAX_TRANSFERS = 4  # Number of recent framed transfers kept for retransmission
+PROGRESSIVE_SIZE = 128  # Final width/height of CAMERA progressive images
+PROGRESSIVE_LAYERS = 4  # Thumbnail plus refinement layers, each doubling the resolution
+FINAL_TOKEN = b"END_OF_STREAM"  # Ends every command's responses; must not appear in regular messages
+LOG_LEVEL = os.environ.get("SARDRONE_LOG_LEVEL", "INFO").upper()  # DEBUG prints every packet sent
+
+def split_options(args):
+    """
+    Splits command arguments into positional arguments and lower-cased KEY=VALUE options.
+    Example: CAMERA frame dither=bayer -> (["frame"], {"dither": "bayer"})
+    """
+    positional = []
+    options = {}
+    for arg in args:
+        if "=" in arg:
+            key, value = arg.split("=", 1)
+            options[key.lower()] = value.lower()
+        else:
+            positional.append(arg)
+    return positional, options
 
 # Base command class
 class Command:
@@ -54,13 +82,20 @@ class HistoryCommand(Command):
     def execute(self, args, handler):
         try:
             if len(args) == 0:
-                return handler.send_response("Usage: HISTORY (# of packets)", handler.rfm9x)
-            count = int(args[0])
+                return handler.send_response("Usage: HISTORY (# of packets | first-last seq)", handler.rfm9x)
             history = handler.packet_history
-            to_resend = history[-count:] if count <= len(history) else history
-            handler.send_response(f"→ Resending last {len(to_resend)} packets", handler.rfm9x)
-            for packet in to_resend:
-                handler.rfm9x.send(packet)
+            if "-" in args[0]:
+                first, last = args[0].split("-", 1)
+                to_resend = history.range(int(first), int(last) + 1)
+            else:
+                to_resend = history.last(int(args[0]))
+            # Old END_OF_STREAM tokens would end the wrong request on the basestation
+            to_resend = [(seq, packet) for seq, packet in to_resend if not packet.endswith(FINAL_TOKEN)]
+            if to_resend:
+                handler.send_response(f"→ Resending packets {to_resend[0][0]}-{to_resend[-1][0]}", handler.rfm9x)
+            else:
+                handler.send_response("→ No packets in history for that range", handler.rfm9x)
+            handler.rfm9x.send_burst([handler.retag(packet) for _, packet in to_resend], PRIORITY_BULK)
             handler.send_final_token()
         except Exception as e:
             handler.send_response(f"[REQUEST ERROR] Invalid argument: {e}", handler.rfm9x)
@@ -83,6 +118,7 @@ class EchoCommand(Command):
             start_time = time.time()
 
             for i in range(times):
+                handler.check_cancelled()
                 bytes_sent = handler.send_response(message, handler.rfm9x)
                 total_bytes_sent += bytes_sent
                 time.sleep(0.1)  # simulate delay between packets
@@ -97,6 +133,9 @@ class EchoCommand(Command):
             handler.send_response(f"[THROUGHPUT] {throughput:.2f} bytes/sec | [LATENCY] {latency_per_packet:.4f} sec/packet", handler.rfm9x)
             time.sleep(0.1)
             handler.send_final_token()
+        except Cancelled as e:
+            handler.send_response(f"[CANCELLED] ECHO {e}", handler.rfm9x)
+            handler.send_final_token()
         except Exception as e:
             handler.send_response(f"[REQUEST ERROR] Invalid argument: {e}", handler.rfm9x)
             time.sleep(0.1)
@@ -106,72 +145,201 @@ class DetectCommand(Command):
     name = "DETECT"
 
     def execute(self, args, handler):
+        # Crops go out as binary frames unless the legacy Base64 pipeline is requested
+        args, options = split_options(args)
+        framed = not (args and args[0].lower() == "text")
+        dithering = options.get("dither", "none")
+        # Progress stamps cost airtime and timings are in STATS now, so framed mode skips them.
+        # Text mode keeps them: they delimit the Base64 crops for the basestation.
+        stamps = options.get("stamps", "off" if framed else "on")
+        # Framed crops of one frame go out as a single mosaic transfer (boxes and confidences included)
+        mosaic = options.get("mosaic", "on" if framed else "off")
+        try:
+            iou_thresh = float(options.get("iou", IOU_THRESH))
+            max_detections = int(options.get("top", MAX_DETECTIONS))
+            frames = max(1, int(options.get("frames", 1)))
+            fec = float(options.get("fec", handler.fec_ratio))
+        except ValueError:
+            dithering = None
+        codec = options.get("codec", handler.codec)
+        if dithering not in DITHER_MODES or stamps not in ("on", "off") or mosaic not in ("on", "off") \
+                or (mosaic == "on" and not framed) or codec not in CODEC_IDS:
+            handler.send_response(f"Usage: DETECT [text] [dither={'|'.join(DITHER_MODES)}] [iou=0-1] [top=N] [frames=N] [stamps=on|off] [mosaic=on|off] [fec=ratio] [codec={'|'.join(CODEC_IDS)}]", handler.rfm9x)
+            return handler.send_final_token()
+
         # start overall timer
         t0 = time.time()
-        def stamp(msg):
+        def stamp(msg, always=False):
             elapsed = time.time() - t0
-            handler.send_response(f"[{elapsed:0.2f}] {msg}", handler.rfm9x)
+            if stamps == "on" or always:
+                handler.send_response(f"[{elapsed:0.2f}] {msg}", handler.rfm9x)
+            else:
+                print(f"[{elapsed:0.2f}] {msg}")
 
         # 0) command received
         stamp("Command received")
 
-        # 1) capture
-        img_path = None
-        while img_path is None:
-            img_path = capture_photo(width=640, height=640, fmt="png")
-        stamp(f"Image captured: {os.path.basename(img_path)}")
+        # 1) capture, 2) inference and 3) encoding run as pipeline stages (see pipeline.py)
+        def capture():
+            with metrics.timed("capture"):
+                for _ in range(CAPTURE_ATTEMPTS):
+                    frame = capture_frame(width=640, height=640)
+                    if frame is not None:
+                        return frame
+                    print("Retrying capture...")
+            raise RuntimeError(f"capture failed after {CAPTURE_ATTEMPTS} attempts")
 
-        # 2) inference, crop & send via LoRa
-        try:
-            stamp("Starting inference")
-            crop_paths = run_inference(img_path, conf_thresh=0.5)
-            stamp(f"Inference completed, {len(crop_paths)} crop(s) found")
+        def infer(frame):
+            return run_inference(frame, conf_thresh=0.5, iou_thresh=iou_thresh,
+                                 max_detections=max_detections, with_boxes=mosaic == "on")
 
-            if not crop_paths:
-                stamp("No persons detected")
-            else:
-                for p in crop_paths:
-                    base = os.path.basename(p)
-                    stamp(f"Preparing to send {base}")
-                    b64  = convert_image(p, bit_depth=4, size=(64, 64))
-                    send_start = time.time()
-                    success = send_file(b64, handler)
-                    send_end = time.time()
-                    status = "SENT" if success else "SEND FAILED"
-                    stamp(f"{status} {base} (send time: {send_end - send_start:0.2f}s)")
+        def encode(crop):
+            with metrics.timed("encode"):
+                if mosaic == "on":
+                    return convert_mosaic(crop, bit_depth=4, size=(64, 64), dithering=dithering, codec=codec)
+                if framed:
+                    return convert_image_framed(crop, bit_depth=4, size=(64, 64), dithering=dithering, codec=codec)
+                return convert_image(crop, bit_depth=4, size=(64, 64), dithering=dithering)
 
+        # 4) send each crop via LoRa while the next one is being prepared
+        try:
+            sent = 0
+            for event in pipelined_detect(capture, infer, encode, frames=frames, batch=mosaic == "on",
+                                          check=handler.check_cancelled):
+                handler.check_cancelled()
+                if event[0] == "frame":
+                    _, k, count = event
+                    stamp(f"Frame {k + 1}/{frames}: inference completed, {count} crop(s) found")
+                    if not count:
+                        stamp("No persons detected")
+                    continue
+
+                _, k, idx, payload = event
+                if mosaic == "on":
+                    base = "crops" if frames == 1 else f"frame_{k + 1}_crops"
+                else:
+                    base = f"crop_{idx}" if frames == 1 else f"frame_{k + 1}_crop_{idx}"
+                stamp(f"Preparing to send {base}")
+                send_start = time.time()
+                if mosaic == "on":
+                    success = send_frames(payload, handler, content=CONTENT_MOSAIC, fec=fec, codec=codec)
+                elif framed:
+                    success = send_frames(payload, handler, fec=fec, codec=codec)
+                else:
+                    success = send_file(payload, handler)
+                send_end = time.time()
+                status = "SENT" if success else "SEND FAILED"
+                stamp(f"{status} {base} (send time: {send_end - send_start:0.2f}s)")
+                sent += 1
+
+            stamp(f"Inference latency (mean/max): {latency_report()}")
+            if sent:
                 stamp("DETECT pipeline complete")
                 handler.send_response("[RESULT] DETECTION COMPLETE", handler.rfm9x)
 
+        except Cancelled as e:
+            stamp(f"[CANCELLED] DETECT {e}", always=True)
         except Exception as e:
-            stamp(f"ERROR during pipeline: {e}")
+            stamp(f"ERROR during pipeline: {e}", always=True)
 
-        # 3) end transmission
-        handler.send_final_token()
+        # 5) final total elapsed, before END_OF_STREAM so it stays with this command's responses
+        stamp("Total elapsed")
 
-        # 4) final total elapsed
-        total = time.time() - t0
-        handler.send_response(f"[{total:0.2f}] Total elapsed", handler.rfm9x)
+        # 6) end transmission
+        handler.send_final_token()
 
 class CameraCommand(Command):
     name = "CAMERA"
 
     def execute(self, args, handler):
         try:
-            image_path = None
-            while image_path is None:
-                image_path = capture_photo()
-                if image_path is None:
-                    print("Retrying capture...")
-                    time.sleep(1)
+            args, options = split_options(args)
+            dithering = options.get("dither", "none")
+            try:
+                fec = float(options.get("fec", handler.fec_ratio))
+                # progressive mode: final size, number of layers and an optional region of interest
+                # given as x1,y1,x2,y2 fractions of the frame
+                size = int(options.get("size", PROGRESSIVE_SIZE))
+                layers = int(options.get("layers", PROGRESSIVE_LAYERS))
+                roi = [float(v) for v in options["roi"].split(",")] if "roi" in options else None
+                # delta mode: level changes up to threshold are ignored; key=on forces a keyframe
+                threshold = int(options.get("threshold", 0))
+                keyframe = options.get("key", "off") == "on"
+                if not 1 <= layers <= 8 or size >> (layers - 1) < 1 or (roi and len(roi) != 4):
+                    raise ValueError
+            except ValueError:
+                dithering = None
+            # Chooses pipeline: binary frames, text/Base64 or raw binary
+            mode = args[0].lower() if args else "frame"
+            # The PNG sent by binary mode is already deflated, so it goes out raw unless asked otherwise
+            codec = options.get("codec", "raw" if mode == "binary" else handler.codec)
+            if dithering not in DITHER_MODES or codec not in CODEC_IDS:
+                return handler.send_response(f"Usage: CAMERA [mode] [dither={'|'.join(DITHER_MODES)}] [fec=ratio] [codec={'|'.join(CODEC_IDS)}] [size=N layers=N roi=x1,y1,x2,y2] [threshold=N key=on]", handler.rfm9x)
+
+            # Image modes use an in-memory frame; binary/hex send it PNG-encoded
+            if mode in ("frame", "text", "progressive", "delta", "binary", "hex"):
+                # A region of interest is cut from a full-resolution frame
+                width = height = (640 if roi else size) if mode == "progressive" else 64
+                capture = capture_png if mode in ("binary", "hex") else capture_frame
+                image = None
+                with metrics.timed("capture"):
+                    for _ in range(CAPTURE_ATTEMPTS):
+                        handler.check_cancelled()
+                        image = capture(width=width, height=height)
+                        if image is not None:
+                            break
+                        print("Retrying capture...")
+                        time.sleep(1)
+                if image is None:
+                    raise RuntimeError(f"capture failed after {CAPTURE_ATTEMPTS} attempts")
+
+            if mode == "frame":
+                bit_depth = 4
+                size = (64, 64)
+                with metrics.timed("encode"):
+                    payload = convert_image_framed(image, bit_depth=bit_depth, size=size, dithering=dithering,
+                                                   codec=codec)
+                handler.send_response(f"Sending framed image {size}, {bit_depth}bpp", handler.rfm9x)
+                success = send_frames(payload, handler, fec=fec, codec=codec)
+                handler.send_response("SCREENSHOT SENT" if success else "SEND FAILED", handler.rfm9x)
+
+            elif mode == "delta":
+                # Only the difference from the last frame the basestation acknowledged goes on air
+                bit_depth = 4
+                size = (64, 64)
+                with metrics.timed("encode"):
+                    levels = quantize_image(image, bit_depth=bit_depth, size=size, dithering=dithering)
+                    content, payload = handler.delta.encode(levels, bit_depth, codec=codec, threshold=threshold,
+                                                            keyframe=keyframe)
+                kind = "delta" if content == CONTENT_DELTA else "key"
+                handler.send_response(f"Sending {kind} frame {size}, {bit_depth}bpp ({len(payload)} bytes)", handler.rfm9x)
+                # Allocated here: the control worker may take the next id while this one is on air
+                transfer_id = handler.new_transfer_id()
+                success = send_frames(payload, handler, content=content, fec=fec, codec=codec,
+                                      transfer_id=transfer_id)
+                handler.delta.delivered(transfer_id, success)
+                handler.send_response("SCREENSHOT SENT" if success else "SEND FAILED", handler.rfm9x)
 
-            # Chooses pipeline: text/Base64 or raw binary
-            mode = args[0].lower() if args else "text"
+            elif mode == "progressive":
+                if roi:
+                    x1, y1, x2, y2 = (int(min(max(v, 0.0), 1.0) * 640) for v in roi)
+                    image = image[y1:max(y2, y1 + 1), x1:max(x2, x1 + 1)]
+                with metrics.timed("encode"):
+                    payloads = convert_progressive(image, bit_depth=4, size=(size, size), layers=layers,
+                                                   dithering=dithering, codec=codec)
+                handler.send_response(f"Sending progressive image {(size, size)}, {layers} layers", handler.rfm9x)
+                # Each layer is its own transfer, so the basestation can show it as soon as it lands
+                for layer in payloads:
+                    success = send_frames(layer, handler, content=CONTENT_LAYER, fec=fec, codec=codec)
+                    if not success:
+                        break
+                handler.send_response("SCREENSHOT SENT" if success else "SEND FAILED", handler.rfm9x)
 
-            if mode == "text":
+            elif mode == "text":
                 bit_depth = 4
                 size = (64, 64)
-                b64 = convert_image(image_path, bit_depth=bit_depth, size=size)
+                with metrics.timed("encode"):
+                    b64 = convert_image(image, bit_depth=bit_depth, size=size, dithering=dithering)
                 if not b64:
                     return handler.send_response("Image conversion failed", handler.rfm9x)
 
@@ -180,29 +348,144 @@ class CameraCommand(Command):
                 handler.send_response("SCREENSHOT SENT" if success else "SEND FAILED", handler.rfm9x)
 
             elif mode == "binary":
-                data = convert_binary(image_path)
+                data = image
                 handler.send_response(f"Sending binary image ({len(data)} bytes)", handler.rfm9x)
+                success = send_frames(encode(data, codec), handler, content=CONTENT_FILE, fec=fec, codec=codec)
+                handler.send_response("BINSCREEN SENT" if success else "SEND FAILED", handler.rfm9x)
+
+            elif mode == "hex":
+                data = image
+                handler.send_response(f"Sending hex image ({len(data)} bytes)", handler.rfm9x)
                 success = send_binary(data, handler)
                 handler.send_response("BINSCREEN SENT" if success else "SEND FAILED", handler.rfm9x)
 
             else:
-                handler.send_response("Usage: CAMERA [text|binary]", handler.rfm9x)
+                handler.send_response("Usage: CAMERA [frame|text|progressive|delta|binary|hex]", handler.rfm9x)
 
+        except Cancelled as e:
+            handler.send_response(f"[CANCELLED] CAMERA {e}", handler.rfm9x)
         except Exception as e:
             handler.send_response(f"[SCREENSHOT ERROR] {e}", handler.rfm9x)
+        finally:
+            handler.send_final_token()
+
+class StatsCommand(Command):
+    name = "STATS"
+
+    def execute(self, args, handler):
+        """
+        Sends the metrics summary as one binary frame (see metrics.pack_stats).
+        STATS RESET clears the histograms.
+        """
+        if args and args[0].upper() == "RESET":
+            metrics.reset()
+            handler.send_response("Metrics reset", handler.rfm9x)
+        else:
+            frame = pack_frame(CONTENT_STATS, handler.new_transfer_id(), 0, 1, metrics.pack_stats())
+            handler.rfm9x.send_with_ack(frame, PRIORITY_TELEMETRY)
+        handler.send_final_token()
+
+class MtuCommand(Command):
+    name = "MTU"
+
+    def execute(self, args, handler):
+        """
+        Payload size negotiation, sent by the basestation at session start:
+          MTU <bytes>        agree on min(bytes, 252); framed transfers adapt below it
+          MTU FIXED <bytes>  same ceiling, but every frame uses exactly that size
+          MTU STATS          per-size transfer, loss and goodput figures
+        """
+        try:
+            if args and args[0].upper() == "STATS":
+                for line in handler.payload_sizer.report():
+                    handler.send_response(line, handler.rfm9x)
+                return
+            fixed = bool(args) and args[0].upper() == "FIXED"
+            requested = int(args[1] if fixed else args[0]) if args else RFM9X_MAX_PAYLOAD
+            handler.max_packet_size = handler.payload_sizer.set_mtu(requested, adaptive=not fixed)
+            handler.send_response(f"[MTU] {handler.max_packet_size}", handler.rfm9x)
+        except (IndexError, ValueError):
+            handler.send_response("Usage: MTU (<bytes> | FIXED <bytes> | STATS)", handler.rfm9x)
+        finally:
+            handler.send_final_token()
+
+class RadioCommand(Command):
+    name = "RADIO"
+
+    def execute(self, args, handler):
+        """
+        RADIO <profile>   switch both ends to a named profile (handshake in radio_profiles.py)
+        RADIO BEST        switch to the measured profile with the best goodput and low loss
+        RADIO STATS       per-profile transfer, loss and goodput figures
+        RADIO             current and available profiles
+        """
+        if args and args[0].upper() == "CONFIRM":
+            # Arrived after the handshake gave up; the basestation falls back on its own
+            return print(f"[RADIO] Late confirmation ignored: {' '.join(args)}")
+        try:
+            arg = args[0].lower() if args else "stats"
+            if arg == "stats":
+                for line in handler.radio.report():
+                    handler.send_response(line, handler.rfm9x)
+                return
+            name = handler.radio.best_profile() if arg == "best" else arg
+            if name is None:
+                handler.send_response("No profile measured yet; send images first", handler.rfm9x)
+            elif name not in PROFILES:
+                handler.send_response(f"Usage: RADIO [{'|'.join(PROFILES)}|best|stats]", handler.rfm9x)
+            elif name != handler.radio.current:
+                handler.radio.switch(name, handler)
+            else:
+                handler.send_response(f"[RADIO] ACTIVE {name}", handler.rfm9x)
+        finally:
+            handler.send_final_token()
+
+class AckCommand(Command):
+    name = "ACK"
+
+    def execute(self, args, handler):
+        """
+        Late selective-repeat ACK for a stored framed transfer: resends only the missing frames.
+        Example command: ACK 12 5 1f
+        """
+        ack = parse_ack(args)
+        if ack is None:
+            return handler.send_response("Usage: ACK <transfer> <first missing> <bitmap>", handler.rfm9x)
+        transfer_id, acked = ack
+        frames = handler.transfers.get(transfer_id)
+        if frames is None:
+            return handler.send_response(f"Transfer {transfer_id} not found in history.", handler.rfm9x)
+        # FEC parity frames (seq >= total) are never resent
+        total = parse_frame(frames[0]).total
+        missing = [seq for seq in range(total) if seq not in acked]
+        handler.resend_frames(frames, missing)
 
 class ResendCommand(Command):
     name = "RESEND"
     
     def execute(self, args, handler):
+        try:
+            self.resend(args, handler)
+        finally:
+            handler.send_final_token()
+
+    def resend(self, args, handler):
         """
         Resends specific packets based on a comma-separated list of packet sequence numbers.
         Example command: RESEND 0,2,5
+        Frames of a stored framed transfer are resent with: RESEND FRAME <transfer> 0,2,5
         """
         if not args:
-            handler.send_response("Usage: RESEND <packet numbers, comma separated>", handler.rfm9x)
+            handler.send_response("Usage: RESEND [FRAME <transfer>] <packet numbers, comma separated>", handler.rfm9x)
             return
         try:
+            frame_mode = args[0].upper() == "FRAME"
+            if frame_mode:
+                frames = handler.transfers.get(int(args[1]))
+                if frames is None:
+                    handler.send_response(f"Transfer {args[1]} not found in history.", handler.rfm9x)
+                    return
+                args = args[2:]
             # Combine all arguments into one string in case spaces are used.
             indices_str = " ".join(args).replace(":", "").strip()
             # Split by commas (and spaces) to extract packet indices.
@@ -215,29 +498,50 @@ class ResendCommand(Command):
             if not indices:
                 handler.send_response("No valid packet indices provided for RESEND.", handler.rfm9x)
                 return
+            if frame_mode:
+                handler.resend_frames(frames, [i for i in indices if i < len(frames)])
+                return
             history = handler.packet_history
             for i in indices:
-                try:
-                    packet = history[i]
-                    handler.rfm9x.send(packet)
-                    print(f"Resent packet {i}")
-                except IndexError:
+                packet = history.get(i)
+                if packet is None:
                     handler.send_response(f"Packet {i} not found in history.", handler.rfm9x)
+                    continue
+                if packet.endswith(FINAL_TOKEN):
+                    continue  # would end the wrong request on the basestation
+                handler.rfm9x.send(handler.retag(packet), PRIORITY_BULK)
+                print(f"Resent packet {i}")
         except Exception as e:
             handler.send_response(f"[RESEND ERROR] {e}", handler.rfm9x)
 
 
 class CommandHandler:
     def __init__(self, rfm9x):
-        self.rfm9x = rfm9x
-        self.rfm9x.ack_delay = 0.01
-        self.rfm9x.node = 1
-        self.rfm9x.destination = 2
-        self.packet_history = []
-        self.max_packet_size = 128
+        # All radio I/O goes through one owner thread (see radio_arbiter.py)
+        self.rfm9x = rfm9x if isinstance(rfm9x, RadioArbiter) else RadioArbiter(rfm9x)
+        rfm9x = self.rfm9x
+        self.packet_history = PacketHistory(MAX_HISTORY_BYTES, MAX_HISTORY)
+        self.transfer_id = 0
+        self.transfers = {}  # transfer id -> list of packed frames
+        self.window_size = 8
+        self.max_packet_size = DEFAULT_PAYLOAD  # raised by MTU negotiation
+        self.payload_sizer = PayloadSizer(self.max_packet_size)
+        self.fec_ratio = 0.0  # default parity ratio for framed transfers; fec= overrides per command
+        self.codec = DEFAULT_CODEC  # image_codecs codec for framed images; codec= overrides per command
+        self.delta = DeltaEncoder()  # reference frame for CAMERA delta
+        self.scheduled = False       # set by CommandScheduler; replies then come from the main loop
+        # Routed replies by kind: "ACK" -> acked seqs of active_transfer, "RADIO" -> CONFIRM args.
+        # One queue each, so the control worker's profile switch and a transfer never eat each other's
+        self.replies = {"ACK": queue.Queue(), "RADIO": queue.Queue()}
+        self.lock = threading.Lock()  # packet history and transfer ids are shared by the workers
+        self.active_transfer = None  # framed transfer whose ACKs are routed to the ARQ sender
+        self.local = threading.local()  # per thread: CancelToken and request id of the running command
+        self.radio = ProfileManager(rfm9x)
         self.logging_enabled = False
         self.timestamp_enabled = False
         self.chunking_enabled = True
+        self.debug = LOG_LEVEL == "DEBUG"  # print every packet sent
+        self.clock = (0, b"")  # (second, "HH:MM:SS") for packet headers
         self.commands = {}
         self.register_commands([
             StatusCommand(),
@@ -247,7 +551,11 @@ class CommandHandler:
             EchoCommand(),
             DetectCommand(),
             CameraCommand(),
+            StatsCommand(),
+            MtuCommand(),
+            RadioCommand(),
             ResendCommand(),
+            AckCommand(),
         ])
 
 
@@ -256,54 +564,187 @@ class CommandHandler:
             self.commands[command.name] = command
 
 
-    def send_response(self, response, rfm9x=None):
-        from datetime import datetime  # just in case it's not at the top
-
+    def send_response(self, response, rfm9x=None, priority=PRIORITY_CONTROL):
+        """
+        Sends a text response in packets of at most max_packet_size bytes. Chunks are copied
+        straight from the encoded response, behind their header, into a packet buffer reused
+        for every packet of the calling thread (sends return once the packet is on air).
+        """
         rfm9x = rfm9x or self.rfm9x
-        encoded_response = response.encode('utf-8')
+        encoded = memoryview(response.encode('utf-8'))
+        tag = self.request_tag()
 
-        # Determine prefix length for timestamp/logging
-        prefix_len = 0
-        if self.logging_enabled and self.timestamp_enabled:
-            prefix_len = 30
+        # Room reserved for the request tag and the timestamp/logging header
+        prefix_len = len(tag)
+        if self.logging_enabled:
+            prefix_len += 30 if self.timestamp_enabled else 20
 
-        max_data_len = self.max_packet_size - prefix_len
-
-        # Chunk the response
         if self.chunking_enabled:
-            chunks = [
-                encoded_response[i:i + max_data_len]
-                for i in range(0, len(encoded_response), max_data_len)
-            ]
+            max_data_len = self.max_packet_size - prefix_len
+            total = -(-len(encoded) // max_data_len)
         else:
-            chunks = [encoded_response]
-
-        total = len(chunks)
-        total_bytes_sent = 0  # <--- Track actual bytes sent
-
-        for idx, chunk in enumerate(chunks, start=1):
-            if self.logging_enabled:
-                if self.timestamp_enabled:
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    prefix = f"[{timestamp} {idx}/{total}] "
-                else:
-                    prefix = f"[{idx}/{total}] "
-                payload = prefix.encode('utf-8') + chunk
-            else:
-                payload = chunk
-
-            print("[DEBUG] Sending payload:", payload)
-            rfm9x.send_with_ack(payload)
-            self.packet_history.append(payload)
+            max_data_len = len(encoded)
+            total = 1
+        buffer = self.packet_buffer(prefix_len + max_data_len)
+
+        total_bytes_sent = 0
+        for idx in range(1, total + 1):
+            chunk = encoded[(idx - 1) * max_data_len:idx * max_data_len]
+            with self.lock:
+                # The header's history seq is taken and stored in one step, so a packet sent by
+                # another worker at the same time cannot carry the same #seq
+                header = tag + self.packet_header(idx, total) if self.logging_enabled else tag
+                size = len(header) + len(chunk)
+                buffer[:len(header)] = header
+                buffer[len(header):size] = chunk
+                payload = buffer[:size]
+                self.packet_history.append(payload)
+
+            if self.debug:
+                print("[DEBUG] Sending payload:", bytes(payload))
+            rfm9x.send_with_ack(payload, priority)
+            total_bytes_sent += size
+
+        return total_bytes_sent
+
+    def packet_buffer(self, size):
+        """
+        This thread's reusable packet buffer (a memoryview) of at least size bytes.
+        """
+        buffer = getattr(self.local, "packet_buffer", None)
+        if buffer is None or len(buffer) < size:
+            buffer = self.local.packet_buffer = memoryview(bytearray(max(size, RFM9X_MAX_PAYLOAD)))
+        return buffer
+
+    def packet_header(self, idx, total):
+        # The history sequence number lets the basestation ask for this packet with RESEND.
+        # Called under self.lock, right before the packet is appended.
+        seq = self.packet_history.next_seq
+        if not self.timestamp_enabled:
+            return b"[#%d %d/%d] " % (seq, idx, total)
+        now = int(time.time())
+        if self.clock[0] != now:  # strftime once per second, not per packet
+            self.clock = (now, time.strftime("%H:%M:%S", time.localtime(now)).encode())
+        return b"[%s #%d %d/%d] " % (self.clock[1], seq, idx, total)
+
+    def new_transfer_id(self):
+        # Transfer ids wrap at one byte; the basestation only tracks recent transfers
+        with self.lock:
+            self.transfer_id = (self.transfer_id + 1) % 256
+            return self.transfer_id
+
+    def record_sent(self, payload):
+        with self.lock:
+            return self.packet_history.append(payload)
+
+    def store_transfer(self, transfer_id, frames):
+        self.transfers[transfer_id] = frames
+        while len(self.transfers) > MAX_TRANSFERS:
+            del self.transfers[next(iter(self.transfers))]
+
+    def resend_frames(self, frames, seqs):
+        # The last resent frame polls the basestation for a fresh ACK
+        if not seqs:
+            return
+        burst = [frames[seq] for seq in seqs]
+        burst[-1] = set_flags(burst[-1], FLAG_POLL)
+        self.rfm9x.send_burst(burst, PRIORITY_BULK)
+        print(f"Resent frames {seqs}")
 
-            total_bytes_sent += len(payload)  # <--- Add actual payload length
+    def wait_for_ack(self, transfer_id, timeout):
+        """
+        Waits for an ACK for the given transfer (active_transfer). Returns the set of
+        acknowledged seqs or None.
+        """
+        return self.wait_for_reply("ACK", timeout)
 
-            if len(self.packet_history) > MAX_HISTORY:
-                self.packet_history.pop(0)
+    def route_reply(self, name, args):
+        """
+        Hands a received message to a command waiting for it: ACKs of the active transfer and
+        the CONFIRM of a profile switch in progress. Returns True if it was taken.
+        """
+        if name == "ACK":
+            ack = parse_ack(args)
+            if ack and ack[0] == self.active_transfer:
+                self.replies["ACK"].put(ack[1])
+                return True
+        elif name == "RADIO" and len(args) == 2 and args[0].upper() == "CONFIRM" and args[1] == self.radio.switching:
+            self.replies["RADIO"].put(args)
+            return True
+        return False
+
+    def wait_for_reply(self, kind, timeout):
+        """
+        Returns the next reply of the given kind routed by route_reply, or None after timeout.
+        Raises Cancelled once STOP cancels the running command.
+        """
+        deadline = time.time() + timeout
+        while True:
+            self.check_cancelled()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            replies = self.replies[kind]
+            if self.scheduled:
+                try:
+                    return replies.get(timeout=min(remaining, CANCEL_POLL))
+                except queue.Empty:
+                    continue
+            # No scheduler running (benchmarks, bench tests): listen on the radio directly
+            packet = self.rfm9x.receive(timeout=remaining, with_ack=True)
+            if not packet:
+                continue
+            parts = packet.decode("utf-8", errors="replace").split()
+            if not parts or not self.route_reply(parts[0].upper(), parts[1:]):
+                print(f"[IGNORED] Received during transfer: {' '.join(parts)}")
+                continue
+            if replies.qsize():
+                return replies.get_nowait()
+
+    def check_cancelled(self):
+        token = getattr(self.local, "token", None)
+        if token is not None:
+            token.check()
+
+    def run_command(self, command, args, token, request=None):
+        """
+        Runs a command on a worker thread; STOP cancels it through token.
+        """
+        self.local.token = token
+        try:
+            with self.answering(request):
+                self.handle_command(command, args)
+        finally:
+            self.local.token = None
 
-        return total_bytes_sent  # <--- Return byte count
+    @contextmanager
+    def answering(self, request):
+        """
+        Tags this thread's responses and END_OF_STREAM with the basestation's request id
+        ("#<id> " in front), so the basestation can match them to the command.
+        """
+        previous = getattr(self.local, "request", None)
+        self.local.request = request
+        try:
+            yield
+        finally:
+            self.local.request = previous
 
+    def request_tag(self):
+        request = getattr(self.local, "request", None)
+        return b"" if request is None else b"#%d " % request
 
+    def retag(self, packet):
+        """
+        A stored packet for HISTORY/RESEND, tagged with the request replaying it instead of the one
+        it was first sent for, so the basestation hands it to the session that asked. Left untagged
+        if the longer tag would not fit.
+        """
+        tag, sep, body = packet.partition(b" ")
+        if not (sep and tag[:1] == b"#" and tag[1:].isdigit()):
+            body = packet
+        packet = self.request_tag() + body
+        return packet if len(packet) <= RFM9X_MAX_PAYLOAD else body
 
     def handle_command(self, command, args):
         try:
@@ -317,10 +758,8 @@ class CommandHandler:
 
     def send_final_token(self, rfm9x=None):
         rfm9x = rfm9x or self.rfm9x
-        FINAL_TOKEN = "END_OF_STREAM"  # Make sure this token does not appear in regular messages.
-        final_packet = FINAL_TOKEN.encode('utf-8')
-        print("[DEBUG] Sending final token:", final_packet)
+        final_packet = self.request_tag() + FINAL_TOKEN
+        if self.debug:
+            print("[DEBUG] Sending final token:", final_packet)
         rfm9x.send_with_ack(final_packet)
-        self.packet_history.append(final_packet)
-        if len(self.packet_history) > MAX_HISTORY:
-            self.packet_history.pop(0)
\ No newline at end of file
+        self.record_sent(final_packet)
\ No newline at end of file
@@ -0,0 +1,67 @@
+import numpy as np
+from framing import CONTENT_IMAGE, CONTENT_DELTA, IMAGE_INFO, DELTA_INFO
+from images import pack_pixels
+from image_codecs import encode, row_stride, DEFAULT_CODEC
+
+'''
+Delta encoding for repeated CAMERA captures. The drone keeps the last frame the basestation
+acknowledged and sends the next one as its difference from it (modulo 2^bit depth), which is
+mostly zeros over a static scene and compresses to a fraction of a full frame. The basestation
+keeps its own copy of recent frames by transfer id (frame_decoder.FrameCache).
+
+With a threshold, level changes up to that size are dropped (the reference value is kept), so
+sensor noise costs nothing. The reference then becomes what the basestation reconstructed, not
+the capture, so both ends stay identical; a full keyframe every KEYFRAME_INTERVAL frames bounds
+how far the picture can drift from the scene.
+'''
+
+KEYFRAME_INTERVAL = 10  # Delta frames between full keyframes
+
+
+class DeltaEncoder:
+    def __init__(self, keyframe_interval=KEYFRAME_INTERVAL):
+        self.keyframe_interval = keyframe_interval
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets the reference; the next frame is a keyframe.
+        """
+        self.reference = None      # (transfer id, levels, bit depth) of the last acknowledged frame
+        self.since_key = 0
+        self.pending = None        # (levels, keyframe, bit depth) of the frame being sent
+
+    def encode(self, levels, bit_depth, codec=DEFAULT_CODEC, threshold=0, keyframe=False):
+        """
+        Returns (content type, payload) for a frame of quantized levels (2D array).
+        Call delivered() with the outcome of the transfer.
+        """
+        height, width = levels.shape
+        reference = self.reference
+        if reference is not None and (reference[1].shape != levels.shape or reference[2] != bit_depth):
+            reference = None
+        if keyframe or reference is None or self.since_key >= self.keyframe_interval:
+            self.pending = (levels, True, bit_depth)
+            payload = IMAGE_INFO.pack(bit_depth, width, height)
+            return CONTENT_IMAGE, payload + encode(pack_pixels(levels, bit_depth), codec, row_stride(width, bit_depth))
+
+        ref_id, ref_levels, _ = reference
+        if threshold:
+            levels = np.where(np.abs(levels - ref_levels) <= threshold, ref_levels, levels)
+        residual = (levels - ref_levels) % (1 << bit_depth)
+        self.pending = (levels, False, bit_depth)
+        payload = DELTA_INFO.pack(ref_id, bit_depth, width, height)
+        return CONTENT_DELTA, payload + encode(pack_pixels(residual, bit_depth), codec, row_stride(width, bit_depth))
+
+    def delivered(self, transfer_id, success):
+        """
+        Makes the frame just sent the reference once the basestation has all of it. A failed
+        transfer leaves the old reference in place, which the basestation still holds.
+        """
+        if self.pending is None:
+            return
+        levels, keyframe, bit_depth = self.pending
+        self.pending = None
+        if success:
+            self.reference = (transfer_id, levels, bit_depth)
+            self.since_key = 0 if keyframe else self.since_key + 1
@@ -0,0 +1,91 @@
+import numpy as np
+
+'''
+Dithering engines for the bit-packed image pipeline. Each engine takes a 2D array of 0-255
+grayscale values and returns quantized levels in 0..(2**bit_depth - 1), ready for packing.
+'''
+
+DITHER_MODES = ("none", "fs", "bayer")
+
+# Error shares for the left, upper-right, upper and upper-left neighbours
+FS_WEIGHTS = np.array([7, 3, 5, 1]) / 16
+
+_WAVEFRONTS = {}  # (height, width) -> cached wavefront index arrays
+
+# 4x4 Bayer index matrix; thresholds are spread evenly over (0, 1)
+BAYER_4 = np.array([
+    [0, 8, 2, 10],
+    [12, 4, 14, 6],
+    [3, 11, 1, 9],
+    [15, 7, 13, 5],
+])
+
+
+def quantize_levels(image, bit_depth):
+    """
+    Plain quantization with no dithering (same mapping as the undithered pipeline).
+    """
+    max_val = (1 << bit_depth) - 1
+    return image.astype(np.int32) * max_val // 255
+
+
+def wavefronts(height, width):
+    """
+    Flat index arrays for each anti-diagonal wavefront: pixel indices into the image and, for
+    the error buffer (one padding row on top, one padding column each side), the pixel's own
+    slot and its four already-processed neighbours.
+    """
+    key = (height, width)
+    if key not in _WAVEFRONTS:
+        stride = width + 2
+        fronts = []
+        for t in range(width + 2 * (height - 1)):
+            y = np.arange(max(0, (t - width + 2) // 2), min(height - 1, t // 2) + 1)
+            x = t - 2 * y
+            own = (y + 1) * stride + x + 1
+            neighbours = np.stack([own - 1, own - stride + 1, own - stride, own - stride - 1], axis=1)
+            fronts.append((y * width + x, own, neighbours))
+        _WAVEFRONTS[key] = fronts
+    return _WAVEFRONTS[key]
+
+
+def floyd_steinberg(image, bit_depth):
+    """
+    Floyd-Steinberg error diffusion. Pixel (y, x) only depends on pixels with a smaller x + 2y,
+    so each anti-diagonal wavefront is processed as one array operation instead of per pixel.
+    """
+    max_val = (1 << bit_depth) - 1
+    step = 255 // max_val  # value the basestation renders for one level
+    height, width = image.shape
+    source = image.astype(np.float64).ravel()
+    levels = np.zeros(height * width, dtype=np.int32)
+    errors = np.zeros((height + 1) * (width + 2))
+
+    for pixels, own, neighbours in wavefronts(height, width):
+        value = np.clip(source[pixels] + errors[neighbours] @ FS_WEIGHTS, 0, 255)
+        level = np.rint(value * max_val / 255)
+        levels[pixels] = level
+        errors[own] = value - level * step
+    return levels.reshape(height, width)
+
+
+def ordered_bayer(image, bit_depth):
+    """
+    Ordered dithering against a tiled 4x4 Bayer threshold matrix; fully vectorized.
+    """
+    max_val = (1 << bit_depth) - 1
+    height, width = image.shape
+    thresholds = (BAYER_4 + 0.5) / BAYER_4.size
+    tiled = np.tile(thresholds, (height // 4 + 1, width // 4 + 1))[:height, :width]
+    scaled = image.astype(np.float64) * max_val / 255
+    return np.clip(np.floor(scaled + tiled), 0, max_val).astype(np.int32)
+
+
+def dither(image, bit_depth, mode="fs"):
+    if mode in (None, False, "none"):
+        return quantize_levels(image, bit_depth)
+    if mode in (True, "fs"):
+        return floyd_steinberg(image, bit_depth)
+    if mode == "bayer":
+        return ordered_bayer(image, bit_depth)
+    raise ValueError(f"Unknown dithering mode: {mode}")
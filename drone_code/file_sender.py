@@ -2,23 +2,35 @@ import time
 import zlib
 import base64
 import binascii
+from framing import split_frames, CONTENT_IMAGE
+from fec import split_frames_fec, interleave
+from image_codecs import codec_flags, DEFAULT_CODEC
+from arq import SelectiveRepeatSender
+from radio_arbiter import PRIORITY_BULK, PRIORITY_TELEMETRY
+
+'''
+Image senders. send_frames is the transfer engine: binary frames with sequence numbers, sent in
+selective-repeat bursts (arq.py). send_file and send_binary are the legacy text pipelines (DETECT
+text, CAMERA text/hex) and stay stop-and-wait on purpose. Their packets are bare Base64/hex text
+with no sequence number, which is what older basestations and the log reconstructors expect, so
+a bitmap ACK has nothing to refer to. Their losses are recovered with RESEND/HISTORY instead.
+'''
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+FILE_ACK_DELAY = 0.1  # radio ack_delay for file transfers (RadioArbiter default otherwise)
 
 # Text (Base64) pipeline
 def send_file(b64_data, handler):
     """
     Sends a Base64-encoded string over LoRa in text mode.
     """
-    handler.rfm9x.ack_delay   = 0.1
-    handler.rfm9x.node        = 1
-    handler.rfm9x.destination = 2
-
     packets = [
         b64_data[i : i + handler.max_packet_size]
         for i in range(0, len(b64_data), handler.max_packet_size)
     ]
     print(f"[SEND] {len(packets)} Base64 packets")
     for pkt in packets:
-        handler.rfm9x.send_with_ack(pkt.encode('ascii'))
+        handler.rfm9x.send_with_ack(pkt.encode('ascii'), PRIORITY_BULK, ack_delay=FILE_ACK_DELAY)
         time.sleep(0.1)
     return True
 
@@ -26,13 +38,10 @@ def send_file(b64_data, handler):
 def send_binary(data_bytes, handler):
     """
     Compresses, hex‑encodes, and sends raw binary data over LoRa.
+    PNG files are already deflated, so they go out as they are.
     """
-    handler.rfm9x.ack_delay   = 0.1
-    handler.rfm9x.node        = 1
-    handler.rfm9x.destination = 2
-
     # First compress the raw bytes
-    compressed = zlib.compress(data_bytes)
+    compressed = data_bytes if data_bytes.startswith(PNG_SIGNATURE) else zlib.compress(data_bytes)
     # Then hex‑encode to get a printable string
     hex_str = binascii.hexlify(compressed).decode('ascii')
 
@@ -42,6 +51,42 @@ def send_binary(data_bytes, handler):
     ]
     print(f"[SEND] {len(packets)} hex‑encoded packets ({len(hex_str)} chars)")
     for pkt in packets:
-        handler.rfm9x.send_with_ack(pkt.encode('ascii'))
+        handler.rfm9x.send_with_ack(pkt.encode('ascii'), PRIORITY_BULK, ack_delay=FILE_ACK_DELAY)
         time.sleep(0.1)
     return True
+
+# Binary framed pipeline (raw payload bytes behind a small header)
+def send_frames(data_bytes, handler, content=CONTENT_IMAGE, fec=None, codec=DEFAULT_CODEC, transfer_id=None):
+    """
+    Splits raw bytes into binary frames and sends them over LoRa with no text encoding,
+    using selective-repeat ARQ instead of a blocking ACK per packet. The frame size comes from
+    the handler's PayloadSizer and adapts to the loss seen on each transfer.
+    fec is the parity ratio for this transfer (handler.fec_ratio if None, 0 for none): the
+    basestation rebuilds lost frames from parity instead of waiting for a retransmission.
+    codec names the image_codecs codec data_bytes was encoded with; its id goes in the flags.
+    transfer_id is allocated here unless the caller needs to know it (handler.new_transfer_id()).
+    """
+    transfer_id = handler.new_transfer_id() if transfer_id is None else transfer_id
+    frame_size = handler.payload_sizer.current()
+    fec = handler.fec_ratio if fec is None else fec
+    content |= codec_flags(codec)
+    if fec > 0:
+        frames, data_frames = split_frames_fec(data_bytes, content, transfer_id, frame_size, ratio=fec)
+        order = interleave(data_frames, len(frames) - data_frames)
+    else:
+        frames = split_frames(data_bytes, content, transfer_id, frame_size)
+        data_frames = len(frames)
+        order = None
+    handler.store_transfer(transfer_id, frames)
+    print(f"[SEND] {len(frames)} framed packets ({len(data_bytes)} bytes, transfer {transfer_id}, "
+          f"{len(frames) - data_frames} parity)")
+
+    sender = SelectiveRepeatSender(handler, window=handler.window_size)
+    success = sender.send(frames, transfer_id, len(data_bytes), data_frames, order)
+    stats = sender.stats
+    handler.payload_sizer.update(stats, success)
+    handler.radio.record(stats, success)
+    handler.send_response(
+        f"[GOODPUT] {stats['goodput']:.2f} bytes/sec | {stats['sent']} frames of {frame_size}B sent, "
+        f"{stats['retransmitted']} retransmitted", handler.rfm9x, PRIORITY_TELEMETRY)
+    return success
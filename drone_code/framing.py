@@ -0,0 +1,129 @@
+import struct
+import binascii
+from collections import namedtuple
+
+'''
+Binary framing for LoRa transfers. Each frame is a small fixed header followed by raw payload
+bytes, so image data goes on air without the Base64/hex expansion of the text pipelines.
+This file is shared verbatim by drone_code and basestation_code.
+'''
+
+FRAME_MAGIC = 0xB5  # never the first byte of a UTF-8 text packet
+
+# magic, flags, transfer id, sequence number, total frames, CRC-16
+HEADER = struct.Struct(">BBBHHH")
+HEADER_SIZE = HEADER.size
+
+# Content type lives in the low bits of flags
+CONTENT_MASK  = 0x07
+CONTENT_IMAGE = 0x01  # IMAGE_INFO + zlib-compressed bit-packed grayscale pixels
+CONTENT_FILE  = 0x02  # zlib-compressed opaque file bytes
+CONTENT_STATS = 0x03  # metrics summary answering STATS; always a single frame
+CONTENT_LAYER = 0x04  # LAYER_INFO + zlib-compressed layer of a progressive image (see images.py)
+CONTENT_MOSAIC = 0x05  # MOSAIC_INFO + CROP_INFO per crop + zlib-compressed packed crops, back to back
+CONTENT_DELTA = 0x06  # DELTA_INFO + compressed residual against an earlier CONTENT_IMAGE/DELTA frame
+
+FLAG_POLL = 0x08  # last frame of a burst; the receiver answers with an ACK
+
+# Sequence numbers after the cumulative ACK point covered by the ACK bitmap
+ACK_WINDOW = 64
+
+# Descriptor at the start of CONTENT_IMAGE transfers: bit depth, width, height
+IMAGE_INFO = struct.Struct(">BHH")
+
+# Descriptor at the start of CONTENT_LAYER transfers: layer index, layer count, bit depth, width, height.
+# Layer 0 is a thumbnail; each later layer carries its pixels minus the previous layer scaled up
+# (nearest neighbor), modulo 2^bit depth
+LAYER_INFO = struct.Struct(">BBBHH")
+
+# Descriptor at the start of CONTENT_MOSAIC transfers: crop count, bit depth, crop width, crop height,
+# followed by one CROP_INFO per crop: box x1, y1, x2, y2 in source frame pixels, confidence
+MOSAIC_INFO = struct.Struct(">BBHH")
+CROP_INFO = struct.Struct(">HHHHe")
+
+# Descriptor at the start of CONTENT_DELTA transfers: transfer id of the reference frame, bit depth,
+# width, height. The packed pixels are the frame minus the reference, modulo 2^bit depth
+DELTA_INFO = struct.Struct(">BBHH")
+
+# Metric ids in STATS payloads: stage times and ACK round trip in ms, retransmitted frames per
+# transfer, goodput in bytes/sec
+METRICS = ("capture", "preprocess", "invoke", "postprocess", "encode", "ack_rtt", "retries", "goodput")
+
+# One STATS entry per metric: id, sample count, p50, p90, p99, max (half floats)
+STATS_ENTRY = struct.Struct(">BHeeee")
+
+Frame = namedtuple("Frame", ["flags", "transfer_id", "seq", "total", "payload"])
+
+
+def frame_crc(flags, transfer_id, seq, total, payload):
+    """
+    CRC-16/CCITT over the header fields and the payload.
+    """
+    header = HEADER.pack(FRAME_MAGIC, flags, transfer_id, seq, total, 0)
+    return binascii.crc_hqx(payload, binascii.crc_hqx(header[:-2], 0xFFFF))
+
+
+def pack_frame(flags, transfer_id, seq, total, payload):
+    crc = frame_crc(flags, transfer_id, seq, total, payload)
+    return HEADER.pack(FRAME_MAGIC, flags, transfer_id, seq, total, crc) + bytes(payload)
+
+
+def parse_frame(packet):
+    """
+    Returns a Frame for a valid binary frame, or None for anything else (text packets, bad CRC).
+    """
+    if len(packet) < HEADER_SIZE or packet[0] != FRAME_MAGIC:
+        return None
+    _, flags, transfer_id, seq, total, crc = HEADER.unpack_from(packet)
+    payload = bytes(packet[HEADER_SIZE:])
+    if crc != frame_crc(flags, transfer_id, seq, total, payload):
+        return None
+    return Frame(flags, transfer_id, seq, total, payload)
+
+
+def split_frames(data, flags, transfer_id, max_packet_size):
+    """
+    Splits data into frames that each fit in max_packet_size bytes, header included.
+    """
+    chunk = max_packet_size - HEADER_SIZE
+    total = max(1, -(-len(data) // chunk))
+    return [
+        pack_frame(flags, transfer_id, seq, total, data[seq * chunk:(seq + 1) * chunk])
+        for seq in range(total)
+    ]
+
+
+def set_flags(packet, extra_flags):
+    """
+    Returns a copy of a packed frame with extra flag bits set (CRC recomputed).
+    """
+    frame = parse_frame(packet)
+    return pack_frame(frame.flags | extra_flags, frame.transfer_id, frame.seq, frame.total, frame.payload)
+
+
+def format_ack(transfer_id, received, total):
+    """
+    Builds the ACK command text for a set of received sequence numbers:
+      ACK <transfer id> <first missing seq> <hex bitmap of seqs after it>
+    """
+    cumulative = 0
+    while cumulative < total and cumulative in received:
+        cumulative += 1
+    bitmap = 0
+    for i in range(ACK_WINDOW):
+        if cumulative + i in received:
+            bitmap |= 1 << i
+    return f"ACK {transfer_id} {cumulative} {bitmap:x}"
+
+
+def parse_ack(args):
+    """
+    Parses the arguments of an ACK command into (transfer id, set of acknowledged seqs).
+    """
+    try:
+        transfer_id, cumulative, bitmap = int(args[0]), int(args[1]), int(args[2], 16)
+    except (IndexError, ValueError):
+        return None
+    acked = set(range(cumulative))
+    acked.update(cumulative + i for i in range(ACK_WINDOW) if bitmap >> i & 1)
+    return transfer_id, acked
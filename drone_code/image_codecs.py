@@ -0,0 +1,145 @@
+import lzma
+import zlib
+from collections import namedtuple
+import numpy as np
+
+'''
+Codec registry for framed transfers. The codec id travels in the high nibble of the frame flags,
+so the receiver knows how to undo it without any extra bytes on air; id 0 is zlib at its default
+level, which is what every framed transfer used before codecs were selectable.
+This file is shared verbatim by drone_code and basestation_code.
+
+Codecs take the payload and its row stride in bytes (0 = no 2-D structure). The predictive codecs
+filter each byte against its neighbours in the packed image, PNG-style with one byte per "pixel":
+  sub    x - left
+  paeth  x - Paeth(left, up, up-left)
+and deflate the (mostly small) residuals at level 9, which is where the entropy coding happens.
+'''
+
+CODEC_SHIFT = 4
+CODEC_MASK = 0xF0
+
+Codec = namedtuple("Codec", ["name", "encode", "decode"])
+
+# Raw LZMA2 stream: the .xz container would add ~60 bytes of headers to every transfer
+LZMA_FILTERS = [{"id": lzma.FILTER_LZMA2, "preset": 9}]
+
+
+def _neighbours(x, stride):
+    """
+    Left, up and up-left bytes of every position in a flat buffer of rows stride bytes long
+    (zero outside the image). The last row may be partial.
+    """
+    n = len(x)
+    col = np.arange(n) % stride
+    left = np.zeros(n, dtype=np.int16)
+    left[1:] = x[:-1]
+    left[col == 0] = 0
+    up = np.zeros(n, dtype=np.int16)
+    if stride < n:
+        up[stride:] = x[:-stride]
+    up_left = np.zeros(n, dtype=np.int16)
+    up_left[1:] = up[:-1]
+    up_left[col == 0] = 0
+    return left, up, up_left
+
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+    return np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+
+
+def _stride(data, stride):
+    return stride if 0 < stride < len(data) else max(1, len(data))
+
+
+def sub_encode(data, stride=0):
+    if not data:
+        return zlib.compress(b"", 9)
+    x = np.frombuffer(data, dtype=np.uint8).astype(np.int16)
+    left, _, _ = _neighbours(x, _stride(data, stride))
+    return zlib.compress(((x - left) & 0xFF).astype(np.uint8).tobytes(), 9)
+
+
+def sub_decode(data, stride=0):
+    residual = np.frombuffer(zlib.decompress(data), dtype=np.uint8)
+    n = len(residual)
+    if not n:
+        return b""
+    stride = _stride(residual, stride)
+    rows = -(-n // stride)
+    padded = np.zeros(rows * stride, dtype=np.int64)
+    padded[:n] = residual
+    return (np.cumsum(padded.reshape(rows, stride), axis=1) & 0xFF).astype(np.uint8).tobytes()[:n]
+
+
+def paeth_encode(data, stride=0):
+    if not data:
+        return zlib.compress(b"", 9)
+    x = np.frombuffer(data, dtype=np.uint8).astype(np.int16)
+    left, up, up_left = _neighbours(x, _stride(data, stride))
+    return zlib.compress(((x - _paeth(left, up, up_left)) & 0xFF).astype(np.uint8).tobytes(), 9)
+
+
+def paeth_decode(data, stride=0):
+    residual = zlib.decompress(data)
+    n = len(residual)
+    stride = _stride(residual, stride)
+    out = bytearray(n)
+    # Each row needs the decoded row above; within a row the left neighbour is sequential
+    for start in range(0, n, stride):
+        a = c = 0
+        for i in range(start, min(start + stride, n)):
+            b = out[i - stride] if i >= stride else 0
+            p = a + b - c
+            pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+            pred = a if pa <= pb and pa <= pc else b if pb <= pc else c
+            a = out[i] = (residual[i] + pred) & 0xFF
+            c = b
+    return bytes(out)
+
+
+CODECS = {
+    0: Codec("zlib",  lambda d, s=0: zlib.compress(d), lambda d, s=0: zlib.decompress(d)),
+    1: Codec("raw",   lambda d, s=0: bytes(d), lambda d, s=0: bytes(d)),
+    2: Codec("zlib1", lambda d, s=0: zlib.compress(d, 1), lambda d, s=0: zlib.decompress(d)),
+    3: Codec("zlib9", lambda d, s=0: zlib.compress(d, 9), lambda d, s=0: zlib.decompress(d)),
+    4: Codec("lzma",
+             lambda d, s=0: lzma.compress(d, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS),
+             lambda d, s=0: lzma.decompress(d, format=lzma.FORMAT_RAW, filters=LZMA_FILTERS)),
+    5: Codec("sub",   sub_encode, sub_decode),
+    6: Codec("paeth", paeth_encode, paeth_decode),
+}
+CODEC_IDS = {codec.name: codec_id for codec_id, codec in CODECS.items()}
+DEFAULT_CODEC = "zlib"
+
+
+def codec_flags(name):
+    """
+    Frame flag bits selecting a codec by name.
+    """
+    return CODEC_IDS[name] << CODEC_SHIFT
+
+
+def codec_of(flags):
+    """
+    Codec named by a frame's flags.
+    """
+    return CODECS[(flags & CODEC_MASK) >> CODEC_SHIFT]
+
+
+def encode(data, name=DEFAULT_CODEC, stride=0):
+    return CODECS[CODEC_IDS[name]].encode(data, stride)
+
+
+def decode(data, flags, stride=0):
+    return codec_of(flags).decode(data, stride)
+
+
+def row_stride(width, bit_depth):
+    """
+    Bytes per row of a bit-packed image (rows are not byte-aligned, so this is the nearest whole
+    number; it only affects how well the predictive codecs do, never correctness).
+    """
+    return max(1, round(width * bit_depth / 8))
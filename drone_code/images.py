@@ -3,6 +3,10 @@ import math
 import zlib
 import png
 import base64
+import numpy as np
+from dithering import dither
+from framing import IMAGE_INFO, LAYER_INFO, MOSAIC_INFO, CROP_INFO
+from image_codecs import encode, row_stride, DEFAULT_CODEC
 
 # Helper to clamp values between 0 and 255
 def clip(value):
@@ -48,8 +52,77 @@ def resize_image(image, new_size):
 
     return new_image
 
-# Convert image to Base64 text: quantize, pack bits, compress, encode
-def convert_image(image_path, bit_depth=4, size=(256, 256), dithering=False):
+# Read a PNG path or an in-memory frame (HxW gray or HxWxC RGB array) into a 2D integer array;
+# same luma weights and rounding as read_image_to_grayscale
+def load_grayscale(source):
+    if isinstance(source, np.ndarray):
+        if source.ndim == 2:
+            return source.astype(np.int32)
+        pixels = source.astype(np.float64)
+    else:
+        reader = png.Reader(source)
+        width, height, rows, info = reader.read()
+        pixels = np.array([np.asarray(row) for row in rows], dtype=np.int32)
+
+        if info.get('greyscale', False):
+            return pixels
+        channels = info.get('planes', 3)
+        pixels = pixels.reshape(height, width, channels).astype(np.float64)
+    # Same expression order as the per-pixel loop so rounding is bit-identical
+    gray = 0.299 * pixels[..., 0] + 0.587 * pixels[..., 1] + 0.114 * pixels[..., 2]
+    return np.rint(gray).astype(np.int32)
+
+# Nearest-neighbor resize via row/column index arrays
+def resize_array(image, new_size):
+    new_width, new_height = new_size
+    orig_height, orig_width = image.shape
+    rows = (np.arange(new_height) * orig_height / new_height).astype(np.intp)
+    cols = (np.arange(new_width) * orig_width / new_width).astype(np.intp)
+    return image[rows[:, None], cols]
+
+# Pack bit_depth-bit values MSB-first into bytes, zero-padding the final byte
+def pack_pixels(values, bit_depth):
+    shifts = np.arange(bit_depth - 1, -1, -1, dtype=np.int32)
+    bits = (values.reshape(-1, 1) >> shifts) & 1
+    return np.packbits(bits.astype(np.uint8)).tobytes()
+
+# Floyd-Steinberg error diffusion on the nested-list image (in place)
+def dither_lists(image, bit_depth):
+    height = len(image)
+    width = len(image[0])
+    max_val = (1 << bit_depth) - 1
+    for y in range(height):
+        for x in range(width):
+            old_pixel = image[y][x]
+            new_pixel_val = round(old_pixel * max_val / 255)
+            new_pixel = int(new_pixel_val * (255 // max_val))
+            error = old_pixel - new_pixel
+            image[y][x] = new_pixel
+
+            # Distribute error
+            if x+1 < width:
+                image[y][x+1] = clip(image[y][x+1] + error * 7 / 16)
+            if x-1 >= 0 and y+1 < height:
+                image[y+1][x-1] = clip(image[y+1][x-1] + error * 3 / 16)
+            if y+1 < height:
+                image[y+1][x] = clip(image[y+1][x] + error * 5 / 16)
+            if x+1 < width and y+1 < height:
+                image[y+1][x+1] = clip(image[y+1][x+1] + error * 1 / 16)
+
+# Quantize and pack an image into a bit-packed grayscale byte string (array-backed).
+# dithering: False/"none", True/"fs" (Floyd-Steinberg) or "bayer" (ordered)
+def pack_image(image, bit_depth=4, size=(256, 256), dithering=False):
+    return pack_pixels(quantize_image(image, bit_depth, size, dithering), bit_depth)
+
+# Resize and quantize an image to a 2D array of bit_depth-bit levels
+def quantize_image(image, bit_depth=4, size=(256, 256), dithering=False):
+    assert 1 <= bit_depth <= 7, "bit_depth must be between 1 and 7"
+
+    image = resize_array(load_grayscale(image), size)
+    return dither(image, bit_depth, dithering)
+
+# Pure-Python reference pipeline, kept for benchmarks and bit-exactness checks
+def pack_image_reference(image_path, bit_depth=4, size=(256, 256), dithering=False):
     assert 1 <= bit_depth <= 7, "bit_depth must be between 1 and 7"
 
     # 1) Load & resize
@@ -60,23 +133,7 @@ def convert_image(image_path, bit_depth=4, size=(256, 256), dithering=False):
 
     # 2) Optional Floyd-Steinberg dithering
     if dithering:
-        for y in range(height):
-            for x in range(width):
-                old_pixel = image[y][x]
-                new_pixel_val = round(old_pixel * max_val / 255)
-                new_pixel = int(new_pixel_val * (255 // max_val))
-                error = old_pixel - new_pixel
-                image[y][x] = new_pixel
- 
-                # Distribute error
-                if x+1 < width:
-                    image[y][x+1] = clip(image[y][x+1] + error * 7 / 16)
-                if x-1 >= 0 and y+1 < height:
-                    image[y+1][x-1] = clip(image[y+1][x-1] + error * 3 / 16)
-                if y+1 < height:
-                    image[y+1][x] = clip(image[y+1][x] + error * 5 / 16)
-                if x+1 < width and y+1 < height:
-                    image[y+1][x+1] = clip(image[y+1][x+1] + error * 1 / 16)
+        dither_lists(image, bit_depth)
 
     # 3) Flatten and quantize pixels
     flat_pixels = []
@@ -99,12 +156,60 @@ def convert_image(image_path, bit_depth=4, size=(256, 256), dithering=False):
         buffer <<= (8 - bits_filled)
         packed_bytes.append(buffer & 0xFF)
 
-    # 5) Compress and Base64-encode
+    return bytes(packed_bytes)
+
+# Convert image to Base64 text: quantize, pack bits, compress, encode
+def convert_image(image, bit_depth=4, size=(256, 256), dithering=False):
+    packed_bytes = pack_image(image, bit_depth, size, dithering)
     compressed = zlib.compress(packed_bytes)
     b64 = base64.b64encode(compressed).decode('ascii')
     print(f"Image converted successfully. Base64 length: {len(b64)}")
     return b64
 
+# Convert image to a framed payload: descriptor + compressed packed pixels, no text encoding.
+# codec is an image_codecs name; the sender puts its id in the frame flags
+def convert_image_framed(image, bit_depth=4, size=(256, 256), dithering=False, codec=DEFAULT_CODEC):
+    packed_bytes = pack_image(image, bit_depth, size, dithering)
+    width, height = size
+    payload = IMAGE_INFO.pack(bit_depth, width, height) + encode(packed_bytes, codec, row_stride(width, bit_depth))
+    print(f"Image converted successfully. Framed payload length: {len(payload)}")
+    return payload
+
+# Layer sizes for a progressive image: each layer halves the next one, ending at size
+def layer_sizes(size, layers):
+    width, height = size
+    return [(max(1, width >> shift), max(1, height >> shift)) for shift in range(layers - 1, -1, -1)]
+
+# Convert image to progressive framed payloads, coarsest first. Layer 0 is a small thumbnail; each
+# later layer sends its quantized pixels minus the previous layer scaled up, modulo 2^bit_depth, so
+# mostly-zero residuals compress well and the final layer is the full image exactly
+def convert_progressive(image, bit_depth=4, size=(128, 128), layers=4, dithering=False, codec=DEFAULT_CODEC):
+    gray = load_grayscale(image)
+    modulus = 1 << bit_depth
+    payloads = []
+    previous = None
+    for index, (width, height) in enumerate(layer_sizes(size, layers)):
+        levels = dither(resize_array(gray, (width, height)), bit_depth, dithering)
+        residual = levels if previous is None else (levels - resize_array(previous, (width, height))) % modulus
+        payloads.append(LAYER_INFO.pack(index, layers, bit_depth, width, height)
+                        + encode(pack_pixels(residual, bit_depth), codec, row_stride(width, bit_depth)))
+        previous = levels
+    print(f"Image converted successfully. Progressive layer lengths: {[len(p) for p in payloads]}")
+    return payloads
+
+# Pack every crop of one frame into a single framed payload: the crops share one compressed stream,
+# so later crops reuse the dictionary built on earlier ones. detections are (crop, box, score)
+def convert_mosaic(detections, bit_depth=4, size=(64, 64), dithering=False, codec=DEFAULT_CODEC):
+    width, height = size
+    header = MOSAIC_INFO.pack(len(detections), bit_depth, width, height)
+    packed = []
+    for crop, box, score in detections:
+        header += CROP_INFO.pack(*box, score)
+        packed.append(pack_image(crop, bit_depth, size, dithering))
+    payload = header + encode(b"".join(packed), codec, row_stride(width, bit_depth))
+    print(f"Mosaic converted successfully. {len(detections)} crops, framed payload length: {len(payload)}")
+    return payload
+
 def convert_binary(image_path):
     with open(image_path, "rb") as f:
         data = f.read()
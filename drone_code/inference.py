@@ -1,23 +1,123 @@
 import os
+import time
+from collections import deque
 import numpy as np
 from PIL import Image
-from tflite_runtime.interpreter import Interpreter
+from tflite_runtime.interpreter import Interpreter, load_delegate
+import metrics
 
-# Load TFLite model
-interpreter = Interpreter(model_path=os.path.join(os.path.dirname(__file__), "yolov5n.tflite"))
-interpreter.allocate_tensors()
+IOU_THRESH = 0.45    # Boxes overlapping a better detection by more than this are suppressed
+MAX_DETECTIONS = 3   # Cap on crops per DETECT; each crop costs seconds of airtime
+CROP_DEBUG_DIR = os.environ.get("SARDRONE_CROP_DIR")  # Set to also save every crop as PNG
 
-# Get model I/O details
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
-input_shape = input_details[0]['shape']  # [1, height, width, channels]
+# Interpreter configuration (overridable per call to load_interpreter)
+MODEL_PATH = os.environ.get("SARDRONE_MODEL", os.path.join(os.path.dirname(__file__), "yolov5n.tflite"))
+NUM_THREADS = int(os.environ.get("SARDRONE_TFLITE_THREADS", os.cpu_count() or 1))
+XNNPACK_DELEGATE = os.environ.get("SARDRONE_XNNPACK")  # Path to an XNNPACK delegate library, if any
+LATENCY_WINDOW = 50  # Recent runs kept for the per-stage latency report
 
+# Loaded lazily by load_interpreter(); main.py loads and warms it up at startup
+interpreter = None
+input_details = None
+output_details = None
+input_shape = None  # [1, height, width, channels]
 
-def preprocess_image(img_path):
+STAGES = ("preprocess", "invoke", "postprocess")
+stage_times = {stage: deque(maxlen=LATENCY_WINDOW) for stage in STAGES}
+
+
+def load_interpreter(model_path=MODEL_PATH, num_threads=NUM_THREADS, xnnpack_delegate=XNNPACK_DELEGATE):
+    """
+    Loads a (float32, uint8 or int8) TFLite model with the given thread count and optional
+    XNNPACK delegate, replacing any previously loaded model.
+    """
+    global interpreter, input_details, output_details, input_shape
+    delegates = []
+    if xnnpack_delegate:
+        try:
+            delegates.append(load_delegate(xnnpack_delegate))
+        except (ValueError, OSError) as e:
+            print(f"[inference] XNNPACK delegate unavailable ({e}), using built-in kernels")
+
+    interpreter = Interpreter(model_path=model_path, num_threads=num_threads,
+                              experimental_delegates=delegates or None)
+    interpreter.allocate_tensors()
+
+    # Get model I/O details
+    input_details = interpreter.get_input_details()
+    output_details = interpreter.get_output_details()
+    input_shape = input_details[0]['shape']
+    for times in stage_times.values():
+        times.clear()
+    print(f"[inference] Loaded {os.path.basename(model_path)} "
+          f"({np.dtype(input_details[0]['dtype']).name} input, {num_threads} threads"
+          f"{', XNNPACK' if delegates else ''})")
+    return interpreter
+
+
+def ensure_interpreter():
+    if interpreter is None:
+        load_interpreter()
+    return interpreter
+
+
+def quantize_input(input_data):
     """
-    Open an image, resize to model's input, normalize, and return the tensor + original PIL image.
+    Maps normalized float32 input onto the model's input type using its (scale, zero point).
+    """
+    detail = input_details[0]
+    dtype = np.dtype(detail['dtype'])
+    if dtype == np.float32:
+        return input_data
+    scale, zero_point = detail['quantization']
+    limits = np.iinfo(dtype)
+    quantized = np.rint(input_data / scale + zero_point)
+    return np.clip(quantized, limits.min, limits.max).astype(dtype)
+
+
+def dequantize_output(output_data, detail):
+    if output_data.dtype == np.float32:
+        return output_data
+    scale, zero_point = detail['quantization']
+    return (output_data.astype(np.float32) - zero_point) * scale
+
+
+def warmup(runs=1):
+    """
+    Invokes the model on a blank input so the first DETECT does not pay first-invoke cost.
+    """
+    ensure_interpreter()
+    _, inp_h, inp_w, channels = input_shape
+    blank = quantize_input(np.zeros((1, inp_h, inp_w, channels), dtype=np.float32))
+    for _ in range(runs):
+        start = time.perf_counter()
+        interpreter.set_tensor(input_details[0]['index'], blank)
+        interpreter.invoke()
+        print(f"[inference] Warmup invoke took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+
+def latency_report():
     """
-    img = Image.open(img_path).convert("RGB")
+    Mean / max milliseconds per stage over the last LATENCY_WINDOW runs.
+    """
+    parts = []
+    for stage in STAGES:
+        times = stage_times[stage]
+        if times:
+            parts.append(f"{stage} {sum(times) / len(times) * 1000:.1f}/{max(times) * 1000:.1f} ms")
+    return " | ".join(parts) if parts else "no inference runs yet"
+
+
+def preprocess_image(image):
+    """
+    Open an image (file path or in-memory RGB array), resize to model's input, normalize,
+    and return the tensor + original PIL image.
+    """
+    ensure_interpreter()
+    if isinstance(image, np.ndarray):
+        img = Image.fromarray(image).convert("RGB")
+    else:
+        img = Image.open(image).convert("RGB")
     _, inp_h, inp_w, _ = input_shape
     resized = img.resize((inp_w, inp_h), Image.BILINEAR)
     img_np = np.array(resized, dtype=np.float32) / 255.0
@@ -25,61 +125,117 @@ def preprocess_image(img_path):
     return img_np.astype(np.float32), img
 
 
-def postprocess(output_data, original_image, conf_thresh=0.5):
+def decode_detections(output_data, conf_thresh=0.5, person_class=0):
+    """
+    Vectorized decode of a [1, N, >=6] output into (boxes, scores) for the person class.
+    Boxes are normalized [x1, y1, x2, y2]. Rows are either [x, y, w, h, conf, cls] or the
+    YOLOv5 layout [x, y, w, h, objectness, class scores...].
+    """
+    dets = output_data[0]
+    if dets.shape[1] == 6:
+        scores = dets[:, 4]
+        keep = (scores > conf_thresh) & (dets[:, 5].astype(np.int32) == person_class)
+    else:
+        class_scores = dets[:, 5:]
+        scores = dets[:, 4] * class_scores[:, person_class]
+        keep = (scores > conf_thresh) & (class_scores.argmax(axis=1) == person_class)
+
+    dets, scores = dets[keep], scores[keep]
+    half_w, half_h = dets[:, 2] / 2, dets[:, 3] / 2
+    boxes = np.stack([dets[:, 0] - half_w, dets[:, 1] - half_h,
+                      dets[:, 0] + half_w, dets[:, 1] + half_h], axis=1)
+    return boxes, scores
+
+
+def non_max_suppression(boxes, scores, iou_thresh=IOU_THRESH, max_detections=MAX_DETECTIONS):
+    """
+    Greedy NMS: keeps the highest-scoring box, drops boxes overlapping it by more than
+    iou_thresh, and repeats. Returns kept indices in descending score order, capped at
+    max_detections.
+    """
+    order = np.argsort(-scores)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size and len(keep) < max_detections:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+        x1 = np.maximum(boxes[best, 0], boxes[rest, 0])
+        y1 = np.maximum(boxes[best, 1], boxes[rest, 1])
+        x2 = np.minimum(boxes[best, 2], boxes[rest, 2])
+        y2 = np.minimum(boxes[best, 3], boxes[rest, 3])
+        inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        iou = inter / (areas[best] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_thresh]
+    return np.array(keep, dtype=np.intp)
+
+
+def postprocess(output_data, original_image, conf_thresh=0.5, iou_thresh=IOU_THRESH,
+                max_detections=MAX_DETECTIONS, debug_dir=None, with_boxes=False):
     """
-    Parse model output and extract person detections, returning list of crop file paths.
-    Supports output_data shape [1, N, >=6].
+    Parse model output and extract person detections, returning a list of RGB crop arrays
+    (views into the original frame, no copies). Supports output_data shape [1, N, >=6].
+    Overlapping boxes are merged with NMS and at most max_detections crops (highest confidence
+    first) are produced. With debug_dir set, each crop is also saved there as crop_N.png.
+    With with_boxes, each item is (crop, (x1, y1, x2, y2) in frame pixels, confidence) instead.
     """
-    w, h = original_image.size
+    frame = np.asarray(original_image)
+    h, w = frame.shape[:2]
     crops = []
-    paths = []
+    detections = []
 
     # Debug: show output vector size
     if output_data.ndim != 3:
         print(f"[ERROR] Unexpected output_data shape: {output_data.shape}")
         return []
 
-    for det in output_data[0]:
-        # Unpack first 6 values (ignore extras)
-        x_c, y_c, bw, bh, conf, cls = det[:6]
-        # Debug: show det length
-        # print(f"[DEBUG] det vector length: {len(det)}")
-
-        if conf > conf_thresh and int(cls) == 0:
-            # Convert to pixel coordinates
-            x1 = int((x_c - bw/2) * w)
-            y1 = int((y_c - bh/2) * h)
-            x2 = int((x_c + bw/2) * w)
-            y2 = int((y_c + bh/2) * h)
-            # Clamp
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(w, x2), min(h, y2)
-            # Crop
-            crop = original_image.crop((x1, y1, x2, y2))
-            crops.append(crop)
-
-    # Ensure output directory exists
-    os.makedirs("crops", exist_ok=True)
-    for idx, crop in enumerate(crops, start=1):
-        out_path = os.path.join("crops", f"crop_{idx}.png")
-        crop.save(out_path, format="png")
-        print(f"[DEBUG] saved {out_path}")
-        paths.append(out_path)
-    return paths
-
-
-def run_inference(image_path, conf_thresh=0.5):
+    boxes, scores = decode_detections(output_data, conf_thresh)
+    keep = non_max_suppression(boxes, scores, iou_thresh, max_detections)
+
+    # Convert to clamped pixel coordinates and drop degenerate boxes
+    pixel_boxes = (boxes[keep] * np.array([w, h, w, h])).astype(np.int32)
+    pixel_boxes[:, 0::2] = np.clip(pixel_boxes[:, 0::2], 0, w)
+    pixel_boxes[:, 1::2] = np.clip(pixel_boxes[:, 1::2], 0, h)
+    for (x1, y1, x2, y2), score in zip(pixel_boxes.tolist(), scores[keep].tolist()):
+        if x2 > x1 and y2 > y1:
+            crops.append(frame[y1:y2, x1:x2])
+            detections.append((crops[-1], (x1, y1, x2, y2), score))
+
+    # Optional debug sink; the LoRa encoder works on the arrays directly
+    if debug_dir:
+        os.makedirs(debug_dir, exist_ok=True)
+        for idx, crop in enumerate(crops, start=1):
+            out_path = os.path.join(debug_dir, f"crop_{idx}.png")
+            Image.fromarray(crop).save(out_path, format="png")
+            print(f"[DEBUG] saved {out_path}")
+    return detections if with_boxes else crops
+
+
+def run_inference(image_path, conf_thresh=0.5, iou_thresh=IOU_THRESH, max_detections=MAX_DETECTIONS,
+                  debug_dir=CROP_DEBUG_DIR, with_boxes=False):
     """
+    image_path may also be an in-memory RGB frame from camera.capture_frame.
     1) Preprocess image
     2) Run TFLite model
-    3) Postprocess and save crops
-    Returns list of crop file paths.
+    3) Postprocess into crops (optionally also saved under debug_dir)
+    Returns list of RGB crop arrays ((crop, box, confidence) with with_boxes). Per-stage latencies go to stage_times and the metrics registry.
     """
     # 1) preprocess
+    t0 = time.perf_counter()
     input_data, orig = preprocess_image(image_path)
+    input_data = quantize_input(input_data)
     # 2) inference
+    t1 = time.perf_counter()
     interpreter.set_tensor(input_details[0]['index'], input_data)
     interpreter.invoke()
     output_data = interpreter.get_tensor(output_details[0]['index'])  # Expect [1, N, >=6]
+    output_data = dequantize_output(output_data, output_details[0])
     # 3) postprocess + save
-    return postprocess(output_data, orig, conf_thresh=conf_thresh)
\ No newline at end of file
+    t2 = time.perf_counter()
+    crops = postprocess(output_data, orig, conf_thresh=conf_thresh, iou_thresh=iou_thresh,
+                        max_detections=max_detections, debug_dir=debug_dir, with_boxes=with_boxes)
+    t3 = time.perf_counter()
+    for stage, seconds in zip(STAGES, (t1 - t0, t2 - t1, t3 - t2)):
+        stage_times[stage].append(seconds)
+        metrics.record(stage, seconds * 1000)
+    return crops
\ No newline at end of file
@@ -5,44 +5,40 @@ import digitalio
 import adafruit_rfm9x
 from lora_setup import get_lora_radio
 from command_handler import CommandHandler
+from scheduler import CommandScheduler
+from inference import load_interpreter, warmup
 
 '''
 The purpose of this module is to communicate with the basestation. This is what should be running at all times on the rover. 
+The loop only receives and hands each message to the command scheduler, which runs commands on a
+worker thread; STOP therefore reaches a command that is still running (see scheduler.py).
 '''
 
 # --- Configuration Parameters ---
-RECEIVE_TIMEOUT = 2.0   # Timeout (seconds) for rfm9x.receive() to wait for a packet
-LOOP_SLEEP = 0.1        # Sleep duration (seconds) in main loop to yield CPU control
+RECEIVE_TIMEOUT = 0.1   # Seconds to wait for a packet from the radio thread before checking for lost contact
 
-rfm9x = get_lora_radio()
-handler = CommandHandler(rfm9x)
+handler = CommandHandler(get_lora_radio())
+rfm9x = handler.rfm9x  # shared with the worker thread
+scheduler = CommandScheduler(handler)
 
+# Load the detector and pay first-invoke cost now rather than on the first DETECT
+load_interpreter()
+warmup()
+
+scheduler.start()
 print("LoRa transceiver is initialized. Ready to receive commands!")
 
 # --- Main Loop ---
 while True:
     packet = rfm9x.receive(timeout=RECEIVE_TIMEOUT, with_ack=True)
     if packet:
+        handler.radio.heard()
         try:
             message = packet.decode("utf-8").strip()
             print(f"[RECEIVED] {message}")
-            print(message)
-            if not message:
-                continue
-
-            parts = message.split()
-            command = parts[0]
-            args = parts[1:]
-
-            # Check if the command is valid using the registered commands
-            if command.upper() in handler.commands:
-                handler.handle_command(command, args)
-            else:
-                response = f"[IGNORED] Unknown command: {command}"
-                rfm9x.send(bytes(response, "utf-8"))
-                handler.send_final_token()
-
+            scheduler.dispatch(message)
         except Exception as e:
             print(f"[ERROR] Packet processing failed: {e}")
-
-    time.sleep(LOOP_SLEEP)
\ No newline at end of file
+    else:
+        # Both ends drop back to the default radio profile after a long silence
+        handler.radio.check_contact()
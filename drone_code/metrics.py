@@ -0,0 +1,93 @@
+import math
+import time
+from contextlib import contextmanager
+from framing import METRICS, STATS_ENTRY
+
+'''
+In-memory metrics registry. Every metric is a log-bucketed histogram: recording is O(1) with
+constant memory however long the drone runs, and percentiles are accurate to one bucket width.
+The STATS command packs the summary into a single frame (see framing.METRICS / STATS_ENTRY)
+instead of spending airtime on human-readable stamps.
+'''
+
+HIST_MIN = 0.01     # Values at or below this land in the first bucket
+HIST_GROWTH = 1.1   # Bucket bounds grow 10% per step, so percentiles are within 10%
+HIST_BUCKETS = 200  # Covers HIST_MIN up to ~2e6
+HALF_FLOAT_MAX = 65504.0
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * HIST_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value <= HIST_MIN:
+            idx = 0
+        else:
+            idx = min(HIST_BUCKETS - 1, math.ceil(math.log(value / HIST_MIN, HIST_GROWTH)))
+        self.counts[idx] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        """
+        Upper bound of the bucket holding the q-quantile (0 < q <= 1), capped at the largest sample.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        running = 0
+        for idx, n in enumerate(self.counts):
+            running += n
+            if running >= rank:
+                return min(HIST_MIN * HIST_GROWTH ** idx, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+
+histograms = {name: Histogram() for name in METRICS}
+
+
+def record(name, value):
+    histograms[name].record(value)
+
+
+@contextmanager
+def timed(name):
+    """
+    Records the duration of the with-block in milliseconds.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, (time.perf_counter() - start) * 1000)
+
+
+def reset():
+    for name in METRICS:
+        histograms[name] = Histogram()
+
+
+def summary():
+    """
+    name -> (count, p50, p90, p99, max) for every metric with samples.
+    """
+    return {
+        name: (h.count, h.percentile(0.5), h.percentile(0.9), h.percentile(0.99), h.max)
+        for name, h in histograms.items() if h.count
+    }
+
+
+def pack_stats():
+    entries = []
+    for name, (count, *values) in summary().items():
+        values = [min(v, HALF_FLOAT_MAX) for v in values]
+        entries.append(STATS_ENTRY.pack(METRICS.index(name), min(count, 0xFFFF), *values))
+    return b"".join(entries)
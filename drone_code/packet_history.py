@@ -0,0 +1,74 @@
+from array import array
+
+'''
+Fixed-capacity history of sent packets keyed by a monotonically increasing sequence number.
+Payloads are copied into one preallocated byte arena, so memory is bounded in bytes, and the
+oldest packets are evicted as the write position laps the arena.
+'''
+
+
+class PacketHistory:
+    def __init__(self, max_bytes, max_packets):
+        self.arena = bytearray(max_bytes)
+        self.offsets = array("I", [0]) * max_packets
+        self.lengths = array("I", [0]) * max_packets
+        self.max_packets = max_packets
+        self.first_seq = 0   # oldest retained sequence number
+        self.next_seq = 0    # sequence number the next append gets
+        self.write_pos = 0   # arena offset for the next payload
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def append(self, packet):
+        """
+        Stores a copy of packet and returns its sequence number. O(1) amortized.
+        """
+        size = len(packet)
+        capacity = len(self.arena)
+        if size > capacity:
+            raise ValueError(f"Packet of {size} bytes exceeds history capacity of {capacity} bytes")
+
+        start = self.write_pos
+        if start + size > capacity:
+            start = 0  # payloads are never split; skip the arena tail and wrap
+
+        # Evict the oldest packets whose storage the new payload (and any skipped tail) covers
+        while len(self):
+            offset = self.offsets[self.first_seq % self.max_packets]
+            if start < self.write_pos:
+                covered = offset >= self.write_pos or offset < start + size
+            else:
+                covered = self.write_pos <= offset < start + size
+            if not covered and len(self) < self.max_packets:
+                break
+            self.first_seq += 1
+
+        self.arena[start:start + size] = packet
+        slot = self.next_seq % self.max_packets
+        self.offsets[slot] = start
+        self.lengths[slot] = size
+        self.write_pos = start + size
+        self.next_seq += 1
+        return self.next_seq - 1
+
+    def get(self, seq):
+        """
+        Returns the packet sent with sequence number seq, or None if it is no longer retained.
+        """
+        if not self.first_seq <= seq < self.next_seq:
+            return None
+        slot = seq % self.max_packets
+        offset = self.offsets[slot]
+        return bytes(self.arena[offset:offset + self.lengths[slot]])
+
+    def range(self, start, stop):
+        """
+        Returns [(seq, packet)] for retained sequence numbers in [start, stop).
+        """
+        start = max(start, self.first_seq)
+        stop = min(stop, self.next_seq)
+        return [(seq, self.get(seq)) for seq in range(start, stop)]
+
+    def last(self, count):
+        return self.range(self.next_seq - count, self.next_seq)
@@ -0,0 +1,87 @@
+'''
+Adaptive payload sizing for framed transfers. Every packet pays the same preamble, header and
+turnaround cost, so on a clean link fewer, larger frames carry more data per second of airtime;
+on a lossy link a lost large frame wastes more airtime, so the size steps back down.
+The ceiling is the MTU agreed with the basestation (MTU command), at most the RFM9x's 252 bytes.
+'''
+
+RFM9X_MAX_PAYLOAD = 252                            # bytes the radio's FIFO can send in one packet
+PAYLOAD_SIZES = (64, 96, 128, 160, 192, 224, 252)  # framed packet sizes the sizer steps through
+DEFAULT_PAYLOAD = 128                              # until a larger MTU is negotiated
+LOSS_HIGH = 0.15    # retransmitted/sent at or above this steps the size down straight away
+LOSS_LOW = 0.02     # at or below this counts toward stepping up
+CLEAN_STREAK = 3    # consecutive clean transfers before trying the next larger size
+
+
+class PayloadSizer:
+    def __init__(self, mtu=DEFAULT_PAYLOAD, adaptive=True):
+        self.mtu = mtu
+        self.adaptive = adaptive
+        self.size = mtu
+        self.streak = 0
+        self.settings = {}  # size -> {"transfers", "frames", "sent", "retransmitted", "failed", "bytes", "elapsed"}
+
+    def sizes(self):
+        return [s for s in PAYLOAD_SIZES if s <= self.mtu] or [self.mtu]
+
+    def set_mtu(self, mtu, adaptive=True):
+        """
+        Applies a negotiated (or fixed) maximum. Adaptive sizing starts from the middle of the
+        allowed range rather than jumping straight to the ceiling.
+        """
+        self.mtu = max(PAYLOAD_SIZES[0], min(mtu, RFM9X_MAX_PAYLOAD))
+        self.adaptive = adaptive
+        sizes = self.sizes()
+        self.size = sizes[len(sizes) // 2] if adaptive else self.mtu
+        self.streak = 0
+        return self.mtu
+
+    def current(self):
+        return self.size
+
+    def update(self, stats, delivered):
+        """
+        Records one ARQ transfer (SelectiveRepeatSender.stats) made at the current size and
+        picks the size for the next one.
+        """
+        setting = self.settings.setdefault(self.size, {"transfers": 0, "frames": 0, "sent": 0, "retransmitted": 0,
+                                                       "failed": 0, "bytes": 0, "elapsed": 0.0})
+        setting["transfers"] += 1
+        setting["frames"] += stats["frames"]
+        setting["sent"] += stats["sent"]
+        setting["retransmitted"] += stats["retransmitted"]
+        setting["failed"] += 0 if delivered else 1
+        setting["bytes"] += stats["bytes"] if delivered else 0
+        setting["elapsed"] += stats["elapsed"]
+        if not self.adaptive:
+            return self.size
+
+        loss = stats["retransmitted"] / stats["sent"] if stats["sent"] else 0.0
+        sizes = self.sizes()
+        idx = sizes.index(self.size) if self.size in sizes else len(sizes) - 1
+        if not delivered or stats["timeouts"] or loss >= LOSS_HIGH:
+            self.streak = 0
+            idx = max(0, idx - 1)
+        elif loss <= LOSS_LOW:
+            self.streak += 1
+            if self.streak >= CLEAN_STREAK:
+                self.streak = 0
+                idx = min(len(sizes) - 1, idx + 1)
+        else:
+            self.streak = 0
+        self.size = sizes[idx]
+        return self.size
+
+    def report(self):
+        """
+        One line per payload size used: transfers, frame loss and goodput.
+        """
+        lines = []
+        for size in sorted(self.settings):
+            s = self.settings[size]
+            loss = s["retransmitted"] / s["sent"] if s["sent"] else 0.0
+            goodput = s["bytes"] / s["elapsed"] if s["elapsed"] else 0.0
+            lines.append(f"{size}B: {s['transfers']} transfers ({s['failed']} failed), "
+                         f"loss {loss * 100:.1f}%, goodput {goodput:.1f} B/s")
+        mode = "adaptive" if self.adaptive else "fixed"
+        return [f"MTU {self.mtu} ({mode}), current {self.size}B"] + lines
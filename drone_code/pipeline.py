@@ -0,0 +1,105 @@
+import queue
+import threading
+
+'''
+Pipelined DETECT. Capture + inference and crop encoding run in background threads connected by
+bounded queues, while the calling thread keeps the radio: crop N+1 is encoded while crop N is on
+air, and frame K+1 is captured and inferred while frame K's crops transmit. The queue depth caps
+how many frames/payloads can be in flight, so memory stays flat however long the stream runs.
+'''
+
+QUEUE_DEPTH = 2   # Items buffered between stages
+POLL = 0.1        # seconds between stop/cancel checks while waiting on a queue
+JOIN_TIMEOUT = 1  # seconds to wait for a stage on the way out; one stuck in capture() is left behind
+_END = object()
+
+
+class _Failure:
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(q, item, stop):
+    # Blocks while the queue is full, but gives up once the consumer has stopped
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=POLL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop, check=None):
+    while not stop.is_set():
+        if check is not None:
+            check()
+        try:
+            return q.get(timeout=POLL)
+        except queue.Empty:
+            pass
+    return _END
+
+
+def pipelined_detect(capture, infer, encode, frames=1, depth=QUEUE_DEPTH, batch=False, check=None):
+    """
+    Generator yielding events in transmit order:
+      ("frame", k, crop_count)     once frame k has been captured and inferred
+      ("crop", k, idx, payload)    an encoded crop ready to send
+    capture() returns a frame, infer(frame) a list of crops, encode(crop) a payload.
+    With batch, encode(crops) packs a whole frame's crops into one payload, yielded as crop 1.
+    An exception in any stage is re-raised in the caller. check() is called on every poll while
+    the caller waits for the next event and may raise to abandon the pipeline (handler.check_cancelled).
+    """
+    stop = threading.Event()
+    detections = queue.Queue(maxsize=depth)
+    encoded = queue.Queue(maxsize=depth)
+
+    def detect_stage():
+        try:
+            for k in range(frames):
+                crops = infer(capture())
+                if not _put(detections, (k, crops), stop):
+                    return
+            _put(detections, _END, stop)
+        except Exception as e:
+            _put(detections, _Failure(e), stop)
+
+    def encode_stage():
+        try:
+            while True:
+                item = _get(detections, stop)
+                if item is _END or isinstance(item, _Failure):
+                    _put(encoded, item, stop)
+                    return
+                k, crops = item
+                if not _put(encoded, ("frame", k, len(crops)), stop):
+                    return
+                if batch:
+                    if crops and not _put(encoded, ("crop", k, 1, encode(crops)), stop):
+                        return
+                    continue
+                for idx, crop in enumerate(crops, start=1):
+                    if not _put(encoded, ("crop", k, idx, encode(crop)), stop):
+                        return
+        except Exception as e:
+            _put(encoded, _Failure(e), stop)
+
+    workers = [threading.Thread(target=detect_stage, daemon=True),
+               threading.Thread(target=encode_stage, daemon=True)]
+    for worker in workers:
+        worker.start()
+    try:
+        while True:
+            item = _get(encoded, stop, check)
+            if item is _END:
+                return
+            if isinstance(item, _Failure):
+                raise item.error
+            yield item
+    finally:
+        # Also reached when the caller abandons the generator; unblocks both stages. A stage inside
+        # a blocking capture()/infer() call is daemonic and only waited for briefly.
+        stop.set()
+        for worker in workers:
+            worker.join(JOIN_TIMEOUT)
@@ -0,0 +1,182 @@
+import queue
+import threading
+import time
+from collections import deque
+
+'''
+Single owner of the RFM9x. One thread does all radio I/O: it listens whenever nothing is waiting
+to go out, and takes sends from three priority classes
+  control    command responses, END_OF_STREAM, the profile handshake
+  telemetry  goodput lines and STATS frames
+  bulk       image frames and file chunks
+Every send blocks its caller until it is on air, so each thread's packets keep their order; the
+classes only decide between threads (the main loop answering STOP while a worker streams a CAMERA
+image). A waiting control packet goes out after the bulk job on air, never behind the whole
+transfer. A class that keeps being passed over gets every FAIR_SHARE-th turn, so a steady stream
+of higher-class packets cannot starve it either.
+
+Radio settings (ack_delay, node, destination) travel with each send instead of being set on the
+shared radio, and profile changes run on the owner thread through configure().
+
+A failed receive is logged and the owner listens again. Should the owner thread still die, every
+queued and later send raises RadioStopped instead of blocking its caller forever.
+'''
+
+PRIORITY_CONTROL = 0
+PRIORITY_TELEMETRY = 1
+PRIORITY_BULK = 2
+
+DEFAULT_SETTINGS = {"ack_delay": 0.01, "node": 1, "destination": 2}
+FAIR_SHARE = 4          # turns a waiting class may be passed over before it goes next
+RECEIVE_SLICE = 0.05    # seconds the owner listens before checking for queued sends
+SEND_LINGER = 0.02      # after a send, how long the owner waits for the sender's next packet
+RECEIVED_QUEUE_SIZE = 32  # received packets not yet picked up; the oldest are dropped beyond this
+
+
+class RadioStopped(RuntimeError):
+    def __init__(self):
+        super().__init__("radio thread stopped")
+
+
+class _Job:
+    def __init__(self, run):
+        self.run = run          # callable taking the raw radio
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RadioArbiter:
+    def __init__(self, rfm9x, settings=None):
+        self.rfm9x = rfm9x
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.applied = {}
+        self.queues = [deque() for _ in (PRIORITY_CONTROL, PRIORITY_TELEMETRY, PRIORITY_BULK)]
+        self.passed_over = [0] * len(self.queues)
+        self.pending = threading.Condition()
+        self.received = queue.Queue(maxsize=RECEIVED_QUEUE_SIZE)
+        self.stopped = False  # set if the owner thread exits; sends then fail straight away
+        self.thread = threading.Thread(target=self._run, name="radio", daemon=True)
+        self.thread.start()
+
+    def __getattr__(self, name):
+        # Read-only view of the radio (profile figures, last_rssi, ...)
+        return getattr(self.rfm9x, name)
+
+    def send(self, data, priority=PRIORITY_CONTROL, **settings):
+        return self.send_burst([data], priority, **settings)
+
+    def send_with_ack(self, data, priority=PRIORITY_CONTROL, **settings):
+        return self.send_burst([data], priority, with_ack=True, **settings)
+
+    def send_burst(self, packets, priority=PRIORITY_BULK, with_ack=False, **settings):
+        """
+        Sends packets back to back with no receive or other send in between. Blocks until they
+        are on air; returns True if every send (and its ACK, with_ack) succeeded.
+        """
+        settings = dict(self.settings, **settings)
+
+        def run(rfm9x):
+            self._apply(settings)
+            send = rfm9x.send_with_ack if with_ack else rfm9x.send
+            ok = True
+            for packet in packets:
+                ok = bool(send(packet)) and ok
+            return ok
+
+        return self._submit(run, priority)
+
+    def configure(self, change):
+        """
+        Runs change(rfm9x) on the owner thread, between sends and receives.
+        """
+        return self._submit(change, PRIORITY_CONTROL)
+
+    def receive(self, timeout=None, **kwargs):
+        """
+        Next packet the owner received (ACKed with the default settings), or None after timeout.
+        """
+        try:
+            return self.received.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _submit(self, run, priority):
+        job = _Job(run)
+        with self.pending:
+            if self.stopped:
+                raise RadioStopped()
+            self.queues[priority].append(job)
+            self.pending.notify()
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def _apply(self, settings):
+        for name, value in settings.items():
+            if self.applied.get(name) != value:
+                setattr(self.rfm9x, name, value)
+                self.applied[name] = value
+
+    def _next_job(self, wait):
+        with self.pending:
+            self.pending.wait_for(lambda: any(self.queues), wait)
+            waiting = [p for p, jobs in enumerate(self.queues) if jobs]
+            if not waiting:
+                return None
+            chosen = waiting[0]
+            for p in waiting[1:]:
+                if self.passed_over[p] >= FAIR_SHARE:
+                    chosen = p
+                    break
+            for p in waiting:
+                self.passed_over[p] = 0 if p == chosen else self.passed_over[p] + 1
+            return self.queues[chosen].popleft()
+
+    def _run(self):
+        linger = 0
+        try:
+            while True:
+                job = None
+                try:
+                    # A sender usually has its next packet ready within milliseconds; listening in
+                    # between would hold it for a whole receive slice
+                    job = self._next_job(linger)
+                    linger = SEND_LINGER if job is not None else 0
+                    if job is None:
+                        self._listen()
+                    else:
+                        job.result = job.run(self.rfm9x)
+                except Exception as e:
+                    if job is None:
+                        print(f"[RADIO] Receive failed: {e}")
+                        time.sleep(RECEIVE_SLICE)
+                    else:
+                        job.error = e
+                finally:
+                    if job is not None:
+                        job.done.set()
+        finally:
+            self._fail_pending()
+
+    def _listen(self):
+        self._apply(self.settings)
+        packet = self.rfm9x.receive(timeout=RECEIVE_SLICE, with_ack=True)
+        if packet is not None:
+            if self.received.full():
+                try:
+                    self.received.get_nowait()
+                except queue.Empty:  # the main loop took it first
+                    pass
+            self.received.put_nowait(packet)
+
+    def _fail_pending(self):
+        with self.pending:
+            self.stopped = True
+            jobs = [job for jobs in self.queues for job in jobs]
+            for jobs in self.queues:
+                jobs.clear()
+        for job in jobs:
+            job.error = RadioStopped()
+            job.done.set()
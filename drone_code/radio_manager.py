@@ -0,0 +1,102 @@
+import time
+from radio_profiles import PROFILES, DEFAULT_PROFILE, SWITCH_TIMEOUT, LOST_CONTACT_TIMEOUT, apply_profile, nominal_bitrate
+
+'''
+Drone side of the radio profile manager: runs the switch handshake described in
+radio_profiles.py, falls back to the default profile when the basestation goes quiet, and keeps
+per-profile transfer figures so image transfers can move to the fastest profile that keeps
+loss low (RADIO BEST).
+'''
+
+MAX_LOSS = 0.1  # Retransmitted share above which a profile is not picked by RADIO BEST
+
+
+class ProfileManager:
+    def __init__(self, rfm9x, name=DEFAULT_PROFILE):
+        self.rfm9x = rfm9x
+        self.current = name
+        self.switching = None  # profile awaiting RADIO CONFIRM
+        self.last_heard = time.time()
+        self.profiles = {}  # name -> {"transfers", "frames", "sent", "retransmitted", "failed", "bytes", "elapsed"}
+
+    def apply(self, name):
+        # On the radio's owner thread, not in the middle of a receive or a burst
+        self.rfm9x.configure(lambda radio: apply_profile(radio, name))
+        self.current = name
+        print(f"[RADIO] Using profile {name} (~{nominal_bitrate(name):.0f} bit/s)")
+
+    def heard(self):
+        self.last_heard = time.time()
+
+    def switch(self, name, handler):
+        """
+        Runs the drone side of the handshake. Returns True once the basestation confirmed the
+        new profile; otherwise the previous profile is restored.
+        """
+        previous = self.current
+        # The main loop routes "RADIO CONFIRM <name>" to us while switching is set
+        self.switching = name
+        try:
+            handler.send_response(f"[RADIO] SWITCH {name}", self.rfm9x)
+            self.apply(name)
+            confirmed = handler.wait_for_reply("RADIO", SWITCH_TIMEOUT)
+        finally:
+            self.switching = None
+        if confirmed:
+            self.heard()
+            handler.send_response(f"[RADIO] ACTIVE {name}", self.rfm9x)
+            return True
+
+        print(f"[RADIO] No confirmation on {name}, back to {previous}")
+        self.apply(previous)
+        return False
+
+    def check_contact(self):
+        """
+        Falls back to the default profile after LOST_CONTACT_TIMEOUT without hearing the
+        basestation; it applies the same rule on its side. Returns True if it fell back.
+        """
+        if self.current != DEFAULT_PROFILE and time.time() - self.last_heard > LOST_CONTACT_TIMEOUT:
+            print(f"[RADIO] Lost contact on {self.current}")
+            self.apply(DEFAULT_PROFILE)
+            self.heard()
+            return True
+        return False
+
+    def record(self, stats, delivered):
+        """
+        Adds one ARQ transfer (SelectiveRepeatSender.stats) to the current profile's figures.
+        """
+        s = self.profiles.setdefault(self.current, {"transfers": 0, "frames": 0, "sent": 0, "retransmitted": 0,
+                                                    "failed": 0, "bytes": 0, "elapsed": 0.0})
+        s["transfers"] += 1
+        s["frames"] += stats["frames"]
+        s["sent"] += stats["sent"]
+        s["retransmitted"] += stats["retransmitted"]
+        s["failed"] += 0 if delivered else 1
+        s["bytes"] += stats["bytes"] if delivered else 0
+        s["elapsed"] += stats["elapsed"]
+
+    def loss(self, name):
+        s = self.profiles[name]
+        return s["retransmitted"] / s["sent"] if s["sent"] else 0.0
+
+    def goodput(self, name):
+        s = self.profiles[name]
+        return s["bytes"] / s["elapsed"] if s["elapsed"] else 0.0
+
+    def best_profile(self, max_loss=MAX_LOSS):
+        """
+        Measured profile with the highest goodput whose loss stays under max_loss, or None.
+        """
+        usable = [name for name, s in self.profiles.items() if s["bytes"] and self.loss(name) <= max_loss]
+        return max(usable, key=self.goodput) if usable else None
+
+    def report(self):
+        lines = [f"Profile {self.current}; available: {', '.join(PROFILES)}"]
+        for name in PROFILES:
+            if name in self.profiles:
+                s = self.profiles[name]
+                lines.append(f"{name}: {s['transfers']} transfers ({s['failed']} failed), "
+                             f"loss {self.loss(name) * 100:.1f}%, goodput {self.goodput(name):.1f} B/s")
+        return lines
@@ -0,0 +1,54 @@
+from collections import namedtuple
+
+'''
+Named LoRa radio profiles and the switch handshake shared by both ends of the link.
+This file is shared verbatim by drone_code and basestation_code.
+
+Switch handshake (either end may start it with RADIO <profile>):
+  1. drone -> base   "[RADIO] SWITCH <profile>"   sent with the old settings
+  2. both ends apply the new profile
+  3. base -> drone   "RADIO CONFIRM <profile>"    first packet with the new settings
+  4. drone -> base   "[RADIO] ACTIVE <profile>"
+If the drone hears no CONFIRM within SWITCH_TIMEOUT it goes back to the old profile; if the
+basestation hears no ACTIVE within SWITCH_TIMEOUT + SWITCH_MARGIN it does the same. After
+LOST_CONTACT_TIMEOUT without hearing the other end, both fall back to DEFAULT_PROFILE.
+'''
+
+RadioProfile = namedtuple("RadioProfile", ["spreading_factor", "signal_bandwidth", "coding_rate", "tx_power"])
+
+PROFILES = {
+    "fast":     RadioProfile(7, 500000, 5, 23),   # the original fixed settings
+    "balanced": RadioProfile(8, 250000, 5, 23),
+    "range":    RadioProfile(10, 125000, 5, 23),
+    "max_range": RadioProfile(12, 125000, 8, 23),
+}
+DEFAULT_PROFILE = "fast"
+
+SWITCH_TIMEOUT = 5.0          # seconds the drone waits for CONFIRM on the new profile
+SWITCH_MARGIN = 2.0           # extra seconds the basestation waits for ACTIVE
+LOST_CONTACT_TIMEOUT = 60.0   # seconds of silence on a non-default profile before falling back
+
+# Directive the basestation writes to its Feather relay (not forwarded over the air)
+RELAY_DIRECTIVE = "!RADIO"
+
+
+def apply_profile(rfm9x, name):
+    profile = PROFILES[name]
+    rfm9x.spreading_factor = profile.spreading_factor
+    rfm9x.signal_bandwidth = profile.signal_bandwidth
+    rfm9x.coding_rate = profile.coding_rate
+    rfm9x.tx_power = profile.tx_power
+    return profile
+
+
+def nominal_bitrate(name):
+    """
+    LoRa raw bit rate in bits/sec: SF * BW / 2^SF * 4 / CR.
+    """
+    p = PROFILES[name]
+    return p.spreading_factor * p.signal_bandwidth / (1 << p.spreading_factor) * 4 / p.coding_rate
+
+
+def relay_directive(name):
+    p = PROFILES[name]
+    return f"{RELAY_DIRECTIVE} {name} {p.spreading_factor} {p.signal_bandwidth} {p.coding_rate} {p.tx_power}"
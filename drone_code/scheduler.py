@@ -0,0 +1,162 @@
+import itertools
+import queue
+import threading
+
+'''
+Drone-side command scheduling. The main loop only receives: every packet is routed here and
+returns straight away, so STOP and STATUS are heard while a DETECT or ECHO 100 is still running.
+
+  - ACKs for the transfer in progress and RADIO CONFIRM during a profile switch go to the
+    handler's reply queue, where the waiting ARQ sender / profile switch picks them up
+  - STOP is handled on the spot: it cancels the running commands through their CancelTokens and
+    drops queued ones, each with a [CANCELLED] line and its own END_OF_STREAM
+  - late ACKs (resend requests for stored transfers) are answered on the spot too
+  - quick control commands (STATUS, HELP, STATS, MTU) go to a control worker of their own, so
+    they are answered while a transfer is running
+  - everything else waits in a priority queue (RADIO/RESEND ahead of bulk transfers) for the
+    command worker
+
+Commands from the basestation carry a request id ("#<id> STATUS"); every response to the command,
+END_OF_STREAM included, is sent with the same tag (CommandHandler.answering).
+
+Sends from the worker and the main loop are ordered by radio_arbiter.RadioArbiter.
+
+One command worker is the default.
+'''
+
+PRIORITY_CONTROL = 0
+PRIORITY_BULK = 1
+BULK_COMMANDS = ("DETECT", "CAMERA", "ECHO", "HISTORY")  # same split as basestation_core.py
+CONTROL_COMMANDS = ("STATUS", "HELP", "STATS", "MTU")     # run on the control worker
+
+WORKERS = 1
+COMMAND_QUEUE_SIZE = 16  # Commands waiting for a worker; further ones are refused
+CANCEL_POLL = 0.2        # seconds between cancellation checks while waiting for a reply
+
+
+class Cancelled(Exception):
+    def __init__(self):
+        super().__init__("cancelled by STOP")
+
+
+class CancelToken:
+    def __init__(self):
+        self.event = threading.Event()
+
+    def cancel(self):
+        self.event.set()
+
+    @property
+    def cancelled(self):
+        return self.event.is_set()
+
+    def check(self):
+        """
+        Raises Cancelled once the token has been cancelled; long-running loops call this.
+        """
+        if self.event.is_set():
+            raise Cancelled()
+
+
+def command_priority(name):
+    return PRIORITY_BULK if name in BULK_COMMANDS else PRIORITY_CONTROL
+
+
+def split_request(message):
+    """
+    Returns (request id or None, command text) for a message with an optional "#<id> " tag.
+    """
+    tag, _, rest = message.partition(" ")
+    if tag[:1] == "#" and tag[1:].isdigit():
+        return int(tag[1:]), rest.strip()
+    return None, message
+
+
+class CommandScheduler:
+    def __init__(self, handler, workers=WORKERS, queue_size=COMMAND_QUEUE_SIZE):
+        self.handler = handler
+        self.queue = queue.PriorityQueue(maxsize=queue_size)
+        self.control = queue.PriorityQueue(maxsize=queue_size)  # CONTROL_COMMANDS
+        self.order = itertools.count()  # FIFO tie-break within a priority
+        self.running = {}               # worker thread name -> (command name, CancelToken)
+        self.lock = threading.Lock()
+        self.threads = [threading.Thread(target=self._work, args=(self.queue,), name=f"worker-{i}", daemon=True)
+                        for i in range(workers)]
+        self.threads.append(threading.Thread(target=self._work, args=(self.control,), name="control", daemon=True))
+        handler.scheduled = True
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+
+    def dispatch(self, message):
+        """
+        Routes one received text message. Never blocks on a running command.
+        """
+        request, message = split_request(message)
+        parts = message.split()
+        if not parts:
+            return
+        name, args = parts[0].upper(), parts[1:]
+        handler = self.handler
+
+        if handler.route_reply(name, args):
+            return
+        with handler.answering(request):
+            if name == "STOP":
+                return self.stop()
+            if name not in handler.commands:
+                handler.send_response(f"[IGNORED] Unknown command: {parts[0]}")
+                return handler.send_final_token()
+            if name == "ACK" or (name == "RADIO" and args[:1] and args[0].upper() == "CONFIRM"):
+                # Late ACK / late confirmation: no response stream, answer right here
+                return handler.handle_command(name, args)
+
+            commands = self.control if name in CONTROL_COMMANDS else self.queue
+            try:
+                commands.put_nowait((command_priority(name), next(self.order), name, args, request))
+            except queue.Full:
+                handler.send_response(f"[BUSY] {name} refused, {commands.qsize()} commands queued")
+                handler.send_final_token()
+
+    def stop(self):
+        """
+        STOP: cancels the running command(s) and drops queued ones. Each cancelled or dropped
+        command still ends with its own END_OF_STREAM; STOP's reply has one too.
+        """
+        handler = self.handler
+        dropped = []
+        for commands in (self.queue, self.control):
+            while True:
+                try:
+                    dropped.append(commands.get_nowait())
+                except queue.Empty:
+                    break
+        with self.lock:
+            running = list(self.running.values())
+        for _, token in running:
+            token.cancel()
+        for _, _, name, _, request in dropped:
+            with handler.answering(request):
+                handler.send_response(f"[CANCELLED] {name} {Cancelled()}")
+                handler.send_final_token()
+        if running:
+            names = ", ".join(name for name, _ in running)
+            extra = f", dropped {', '.join(item[2] for item in dropped)}" if dropped else ""
+            handler.send_response(f"→ Stopping {names}{extra}")
+            handler.send_final_token()
+        else:
+            handler.handle_command("STOP", [])
+
+    def _work(self, commands):
+        name = threading.current_thread().name
+        while True:
+            _, _, command, args, request = commands.get()
+            token = CancelToken()
+            with self.lock:
+                self.running[name] = (command, token)
+            try:
+                self.handler.run_command(command, args, token, request)
+            finally:
+                with self.lock:
+                    del self.running[name]
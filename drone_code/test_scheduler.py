@@ -0,0 +1,59 @@
+import threading
+import time
+import pytest
+
+pytest.importorskip("tflite_runtime")  # command_handler loads the detector module
+import command_handler
+from scheduler import CommandScheduler
+
+'''
+Scheduler checks against a loopback radio: every packet the drone sends is recorded, nothing is
+ever received, so commands are fed straight to CommandScheduler.dispatch.
+'''
+
+WAIT = 5  # seconds a condition may take to come true
+
+
+class LoopbackRadio:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, data):
+        self.sent.append(bytes(data))
+        return True
+
+    def send_with_ack(self, data):
+        return self.send(data)
+
+    def receive(self, timeout=None, with_ack=False):
+        time.sleep(timeout or 0)
+        return None
+
+
+def wait_until(condition, timeout=WAIT):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def test_stop_frees_worker_from_failing_detect(monkeypatch):
+    # A camera stuck in a capture that never returns a frame; the stage thread is left behind
+    stuck = threading.Event()
+    monkeypatch.setattr(command_handler, "capture_frame", lambda **kwargs: stuck.wait() and None)
+
+    radio = LoopbackRadio()
+    scheduler = CommandScheduler(command_handler.CommandHandler(radio))
+    scheduler.start()
+    scheduler.dispatch("#1 DETECT")
+    assert wait_until(lambda: scheduler.running)
+    scheduler.dispatch("#2 STOP")
+    assert wait_until(lambda: b"#1 END_OF_STREAM" in radio.sent)
+    assert wait_until(lambda: not scheduler.running)
+
+    # The command worker takes the next bulk command
+    scheduler.dispatch("#3 ECHO 1 ping")
+    assert wait_until(lambda: b"#3 END_OF_STREAM" in radio.sent)
+    assert b"#3 ping" in radio.sent